@@ -0,0 +1,400 @@
+"""
+Semantic answer cache per institute namespace (006 migration): a paraphrase of an already answered question
+reuses the stored answer instead of paying for retrieval + Gemini chat.
+Entries = (L2-normalized query embedding, answer, chunk IDs used). Lookup is one matrix-vector product over the
+namespace's entries (numpy, imported on first use); a hit needs cosine similarity >= threshold.
+Not used by the production answer path: n8n (telegram-webhook.json) never consults it. It runs in lib.answer_flow,
+i.e. the load test (in memory, sb=None). With sb, entries persist in answer_cache (006 migration) and are
+reloaded when answer_cache_versions moves (checked every VERSION_TTL_S); nothing bumps versions automatically
+(006 has no triggers on production tables), so a caller must invalidate() after uploads change a namespace.
+Version checks and reloads run on a background thread, one at a time per namespace: lookups keep serving the
+loaded entries meanwhile, and a namespace not loaded yet is a miss. A sample of hits (audit_rate) is audited by
+re-running retrieval: low overlap between fresh and cached chunk IDs flags a suspected false hit.
+Cache failures are logged, never raised (replies come first).
+"""
+import base64
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_AUDIT_RATE = 0.05
+# Audited hits where fewer than this share of the cached chunk IDs come back from a fresh retrieval.
+SUSPECT_OVERLAP_BELOW = 0.5
+VERSION_TTL_S = 10.0
+_PAGE_SIZE = 1000
+# Threads for background version checks / reloads (one namespace each at a time).
+_REFRESH_WORKERS = 4
+
+
+@dataclass
+class CacheHit:
+    entry_id: str
+    answer: str
+    chunk_ids: list[str]
+    similarity: float
+    query_text: str
+
+
+def _np():
+    import numpy as np
+
+    return np
+
+
+def _normalize(vector: Sequence[float]):
+    np = _np()
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else v
+
+
+def _encode(v) -> str:
+    return base64.b64encode(v.astype("<f4").tobytes()).decode("ascii")
+
+
+def _decode(s: str):
+    np = _np()
+    return np.frombuffer(base64.b64decode(s), dtype="<f4")
+
+
+class _Namespace:
+    """
+    Entries of one namespace: row i of `matrix` belongs to ids[i] / answers[i] / ...
+    Rows live in a buffer grown by doubling; appends never move existing rows of a published view,
+    so lookups can search a snapshot outside the lock.
+    """
+
+    def __init__(self, version: int) -> None:
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.ids: list[str] = []
+        self.answers: list[str] = []
+        self.chunk_ids: list[list[str]] = []
+        self.query_texts: list[str] = []
+        self.last_used: list[float] = []
+        self._buf = None
+        self.matrix = None  # float32 view (n, dim) of _buf, or None when empty
+
+    def add(self, entry_id: str, vector, answer: str, chunk_ids: list[str], query_text: str) -> None:
+        np = _np()
+        n = len(self.ids)
+        if self._buf is None or n == self._buf.shape[0]:
+            grown = np.empty((max(16, 2 * n), vector.shape[0]), dtype=np.float32)
+            if n:
+                grown[:n] = self._buf[:n]
+            self._buf = grown
+        self._buf[n] = vector
+        self.matrix = self._buf[: n + 1]
+        self.ids.append(entry_id)
+        self.answers.append(answer)
+        self.chunk_ids.append(list(chunk_ids))
+        self.query_texts.append(query_text)
+        self.last_used.append(time.monotonic())
+
+    def remove(self, positions: Sequence[int]) -> list[str]:
+        drop = set(positions)
+        keep = [i for i in range(len(self.ids)) if i not in drop]
+        removed = [self.ids[i] for i in sorted(drop)]
+        # Fancy indexing copies: snapshots taken before this call keep their rows.
+        self._buf = self.matrix[keep] if keep else None
+        self.matrix = self._buf
+        for name in ("ids", "answers", "chunk_ids", "query_texts", "last_used"):
+            values = getattr(self, name)
+            setattr(self, name, [values[i] for i in keep])
+        return removed
+
+
+class AnswerCache:
+    """
+    sb: Supabase client for persistence, or None for an in-memory cache (load tests).
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        sb=None,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+        version_ttl_s: float = VERSION_TTL_S,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.sb = sb
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.audit_rate = audit_rate
+        self.version_ttl_s = version_ttl_s
+        self._namespaces: dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+        self._refreshing: set[str] = set()  # namespaces with a check / reload in flight
+        self._refresh_pool = None
+        self._rng = random.Random(seed)
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0, "audits": 0, "false_hit_suspects": 0, "reloads": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    # -- versions / loading -------------------------------------------------
+
+    def _remote_version(self, namespace: str) -> int:
+        rows = self.sb.table("answer_cache_versions").select("version").eq("namespace", namespace).execute().data or []
+        return int(rows[0]["version"]) if rows else 0
+
+    def _load(self, namespace: str, version: int) -> _Namespace:
+        ns = _Namespace(version)
+        if self.sb is None:
+            return ns
+        rows: list[dict] = []
+        start = 0
+        while len(rows) < self.max_entries:
+            page = (
+                self.sb.table("answer_cache")
+                .select("id,query_text,embedding,answer,chunk_ids")
+                .eq("namespace", namespace)
+                .eq("version", version)
+                .order("created_at", desc=True)
+                .range(start, start + _PAGE_SIZE - 1)
+                .execute()
+                .data
+                or []
+            )
+            rows.extend(page)
+            if len(page) < _PAGE_SIZE:
+                break
+            start += _PAGE_SIZE
+        if rows:
+            np = _np()
+            rows = rows[: self.max_entries]
+            ns._buf = np.vstack([_decode(r["embedding"]) for r in rows])
+            ns.matrix = ns._buf
+            ns.ids = [str(r["id"]) for r in rows]
+            ns.answers = [r["answer"] for r in rows]
+            ns.chunk_ids = [list(r.get("chunk_ids") or []) for r in rows]
+            ns.query_texts = [r.get("query_text") or "" for r in rows]
+            ns.last_used = [0.0] * len(rows)
+        self._count("reloads")
+        logger.info("answer cache: loaded namespace=%s version=%s entries=%s", namespace, version, len(rows))
+        return ns
+
+    def _namespace(self, namespace: str) -> Optional[_Namespace]:
+        """
+        Loaded entries for namespace, or None while its first load runs. When the version check is due
+        (version_ttl_s), schedules a background check / reload and returns the current entries without waiting.
+        """
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if self.sb is None:
+                if ns is None:
+                    ns = self._namespaces[namespace] = _Namespace(0)
+                return ns
+            due = ns is None or time.monotonic() - ns.checked_at >= self.version_ttl_s
+            if not due or namespace in self._refreshing:
+                return ns
+            self._refreshing.add(namespace)
+            if self._refresh_pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._refresh_pool = ThreadPoolExecutor(max_workers=_REFRESH_WORKERS, thread_name_prefix="answer-cache-refresh")
+            pool = self._refresh_pool
+        pool.submit(self._refresh, namespace, ns)
+        return ns
+
+    def _refresh(self, namespace: str, ns: Optional[_Namespace]) -> None:
+        """Background: re-check the namespace's version; reload its entries when it moved."""
+        try:
+            version = self._remote_version(namespace)
+            if ns is not None and ns.version == version:
+                ns.checked_at = time.monotonic()
+                return
+            fresh = self._load(namespace, version)
+            with self._lock:
+                self._namespaces[namespace] = fresh
+        except Exception:
+            logger.exception("answer cache refresh failed (namespace=%s)", namespace)
+            if ns is not None:
+                ns.checked_at = time.monotonic()  # keep serving; retry after the next TTL
+        finally:
+            with self._lock:
+                self._refreshing.discard(namespace)
+
+    def wait_refreshed(self, timeout: Optional[float] = None) -> bool:
+        """Wait for in-flight background refreshes (tests, warm-up). False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._refreshing:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    # -- lookup / store -----------------------------------------------------
+
+    def lookup(self, namespace: str, vector: Sequence[float]) -> Optional[CacheHit]:
+        """Most similar cached answer with cosine similarity >= threshold, or None."""
+        self._count("lookups")
+        try:
+            ns = self._namespace(namespace)
+            if ns is None:
+                return None
+            q = _normalize(vector)
+            with ns.lock:
+                matrix, ids, answers = ns.matrix, ns.ids, ns.answers
+                chunk_ids, query_texts = ns.chunk_ids, ns.query_texts
+            if matrix is None or matrix.shape[1] != q.shape[0]:
+                return None
+            sims = matrix @ q
+            best = int(sims.argmax())
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                return None
+            hit = CacheHit(
+                entry_id=ids[best],
+                answer=answers[best],
+                chunk_ids=list(chunk_ids[best]),
+                similarity=similarity,
+                query_text=query_texts[best],
+            )
+            with ns.lock:
+                if best < len(ns.ids) and ns.ids[best] == hit.entry_id:
+                    ns.last_used[best] = time.monotonic()
+        except Exception:
+            logger.exception("answer cache lookup failed (namespace=%s)", namespace)
+            return None
+        self._count("hits")
+        return hit
+
+    def store(self, namespace: str, query_text: str, vector: Sequence[float], answer: str, chunk_ids: Sequence[str]) -> Optional[str]:
+        """Add an answered query; evicts the least recently used entries beyond max_entries. Returns the entry id."""
+        try:
+            ns = self._namespace(namespace)
+            if ns is None:
+                return None  # first load still running; the answer is not cached
+            v = _normalize(vector)
+            entry_id = None
+            if self.sb is not None:
+                row = {
+                    "namespace": namespace,
+                    "version": ns.version,
+                    "query_text": query_text,
+                    "embedding": _encode(v),
+                    "answer": answer,
+                    "chunk_ids": list(chunk_ids),
+                }
+                data = self.sb.table("answer_cache").insert(row).execute().data or []
+                entry_id = str(data[0]["id"]) if data else None
+            if entry_id is None:
+                entry_id = f"mem-{namespace}-{self._rng.getrandbits(64):016x}"
+            with ns.lock:
+                ns.add(entry_id, v, answer, list(chunk_ids), query_text)
+                evicted = []
+                if len(ns.ids) > self.max_entries:
+                    excess = len(ns.ids) - self.max_entries
+                    oldest = sorted(range(len(ns.ids)), key=ns.last_used.__getitem__)[:excess]
+                    evicted = ns.remove(oldest)
+            if evicted and self.sb is not None:
+                self.sb.table("answer_cache").delete().in_("id", evicted).execute()
+        except Exception:
+            logger.exception("answer cache store failed (namespace=%s)", namespace)
+            return None
+        self._count("stores")
+        return entry_id
+
+    # -- audits / events ----------------------------------------------------
+
+    def should_audit(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.audit_rate
+
+    def audit(self, hit: CacheHit, fresh_chunk_ids: Sequence[str]) -> tuple[float, bool]:
+        """(share of cached chunk IDs that a fresh retrieval returned, suspected false hit)."""
+        cached = set(hit.chunk_ids)
+        overlap = len(cached & set(fresh_chunk_ids)) / len(cached) if cached else 0.0
+        suspect = overlap < SUSPECT_OVERLAP_BELOW
+        self._count("audits")
+        if suspect:
+            self._count("false_hit_suspects")
+            logger.warning(
+                "answer cache: suspected false hit entry=%s similarity=%.3f overlap=%.2f cached_query=%r",
+                hit.entry_id, hit.similarity, overlap, hit.query_text,
+            )
+        return overlap, suspect
+
+    def record_event(
+        self,
+        institute_id: int,
+        hit: Optional[CacheHit],
+        overlap: Optional[float] = None,
+        suspect: Optional[bool] = None,
+    ) -> None:
+        """One answer_cache_events row per lookup (no-op without sb)."""
+        if self.sb is None:
+            return
+        row = {
+            "institute_id": institute_id,
+            "outcome": "hit" if hit is not None else "miss",
+            "similarity": round(hit.similarity, 4) if hit is not None else None,
+            "entry_id": hit.entry_id if hit is not None else None,
+            "audited": overlap is not None,
+            "chunk_overlap": round(overlap, 3) if overlap is not None else None,
+            "false_hit_suspect": suspect,
+        }
+        try:
+            self.sb.table("answer_cache_events").insert(row).execute()
+        except Exception:
+            logger.exception("Failed to insert answer_cache_events row")
+
+    # -- invalidation -------------------------------------------------------
+
+    def invalidate(self, namespace: str) -> None:
+        """Drop a namespace's entries here and (with sb) everywhere, via the version bump."""
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+        if self.sb is not None:
+            self.sb.rpc("bump_answer_cache_version", {"p_namespaces": [namespace]}).execute()
+
+    def invalidate_chunks(self, chunk_ids: Sequence[str]) -> int:
+        """Drop entries that used any of chunk_ids (e.g. after deleting vectors from Pinecone). Returns local count."""
+        targets = set(chunk_ids)
+        removed = 0
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        for ns in namespaces:
+            with ns.lock:
+                stale = [i for i, ids in enumerate(ns.chunk_ids) if targets.intersection(ids)]
+                if stale:
+                    removed += len(ns.remove(stale))
+        if self.sb is not None:
+            self.sb.rpc("invalidate_answer_cache_chunks", {"p_chunk_ids": list(targets)}).execute()
+        return removed
+
+    def summary(self) -> dict:
+        """Hit rate, LLM calls avoided (= hits) and audit results for this process."""
+        with self._lock:
+            s = dict(self.stats)
+        s["hit_rate"] = round(s["hits"] / s["lookups"], 4) if s["lookups"] else None
+        s["llm_calls_avoided"] = s["hits"]
+        s["false_hit_rate"] = round(s["false_hit_suspects"] / s["audits"], 4) if s["audits"] else None
+        return s
+
+
+def get_answer_cache(sb) -> AnswerCache:
+    """AnswerCache configured from settings (ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_AUDIT_RATE)."""
+    from lib.config import get_settings
+
+    settings = get_settings()
+    return AnswerCache(
+        sb,
+        threshold=settings.answer_cache_threshold,
+        max_entries=settings.answer_cache_max_entries,
+        audit_rate=settings.answer_cache_audit_rate,
+    )
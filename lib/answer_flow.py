@@ -0,0 +1,213 @@
+"""
+Python reference of the Telegram answer path in n8n-workflows/telegram-webhook.json:
+parse update → insert query_logs → embed → Pinecone query → Gemini chat → ESCALATE? clarify : reply.
+Services are injected (AnswerDeps), so the same flow runs against real clients or local stand-ins
+(scripts/loadtest_answer_path.py). Each step is timed into a lib.timing trace (embed, vector_query, llm, db, send).
+With an AnswerCache (lib.answer_cache), a query close enough to an answered one skips Pinecone + Gemini chat;
+storing new answers, cache events and hit audits run on a background thread after the reply is sent and the
+timings are recorded (drain_after_reply() waits for them).
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from lib.timing import QueryTrace, start_trace
+
+if TYPE_CHECKING:
+    from lib.answer_cache import AnswerCache
+
+logger = logging.getLogger(__name__)
+
+ESCALATE = "ESCALATE"
+# Messages copied from the n8n workflow nodes so replies match production.
+CLARIFY_MESSAGE = (
+    "I couldn't find a clear answer in your study material. Could you add a bit more detail "
+    "(e.g. chapter or topic) or rephrase? If you'd prefer to send this to your TA, reply with **escalate**."
+)
+MISSING_TEXT_MESSAGE = (
+    "I couldn't read your question. Please send your doubt as text (or as a photo with a caption) "
+    "so I can look it up in your study material."
+)
+# Sent when a step fails, so the student is not left without a reply.
+ERROR_MESSAGE = "Something went wrong, please try again."
+# Retriever topK in telegram-webhook.json (v6.json uses 30).
+DEFAULT_TOP_K = 12
+# Threads for post-reply cache work (store / audit / event); it is off the request path, so a few suffice.
+AFTER_REPLY_WORKERS = 4
+
+_after_reply_pool: Optional[ThreadPoolExecutor] = None
+_after_reply_pending: set[Future] = set()
+_after_reply_lock = threading.Lock()
+
+
+@dataclass
+class AnswerDeps:
+    """Service calls used by the flow. Any of them may raise; the flow then logs it and sends ERROR_MESSAGE."""
+
+    embed: Callable[[str], list[float]]
+    query: Callable[[list[float], str, int], list[dict]]  # (vector, namespace, top_k) -> matches
+    chat: Callable[[str, list[str]], str]  # (question, context texts) -> answer or "ESCALATE"
+    log_query: Callable[[dict], Optional[str]]  # query_logs row -> id
+    mark_clarification: Callable[[str], None]  # query_logs id
+    send: Callable[[Any, str], None]  # (chat_id, text)
+    get_file: Optional[Callable[[str], Any]] = None  # Telegram getFile for photo messages; timed as "send"
+    record_timings: Optional[Callable[[QueryTrace, int, Optional[str]], None]] = None
+    cache: Optional["AnswerCache"] = None
+
+
+@dataclass
+class AnswerResult:
+    status: str  # "answered" | "clarify" | "missing_text" | "error"
+    reply_text: str
+    trace: QueryTrace
+    error_stage: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+
+def parse_update(update: dict, institute_id: int) -> dict:
+    """Same fields as the n8n 'Set institute_id and parse' node."""
+    message = (update or {}).get("message") or {}
+    sender = message.get("from") or {}
+    photo = message.get("photo")
+    return {
+        "institute_id": institute_id,
+        "student_telegram_id": str(sender.get("id", "")),
+        "student_name": sender.get("first_name") or "",
+        "query_text": message.get("text") or message.get("caption") or "",
+        "is_photo": bool(photo),
+        "chat_id": (message.get("chat") or {}).get("id"),
+        "photo_file_id": photo[-1].get("file_id") if photo else None,
+        "update_id": (update or {}).get("update_id"),
+    }
+
+
+def _match_text(match: dict) -> str:
+    md = match.get("metadata") or {}
+    return md.get("text") or md.get("pageContent") or ""
+
+
+def handle_update(update: dict, deps: AnswerDeps, institute_id: int = 1, top_k: int = DEFAULT_TOP_K) -> AnswerResult:
+    """
+    Run one Telegram update through the answer path. Never raises: a failing step is logged and reported in
+    error_stage / error. Before the reply, the student gets ERROR_MESSAGE (unless sending is what failed) and the
+    status is 'error'; after it (clarification mark), status and reply_text stay as sent. Timings are recorded either way.
+    """
+    msg = parse_update(update, institute_id)
+    namespace = str(institute_id)
+    cache = deps.cache
+    hit = None
+    vector = None
+    chunk_ids: list[str] = []
+    error_stage = error = None
+    replied = False
+    with start_trace() as trace:
+        stage = "db"
+        query_log_id = None
+        try:
+            with trace.stage("db"):
+                query_log_id = deps.log_query({
+                    k: msg[k] for k in ("institute_id", "student_telegram_id", "student_name", "query_text", "is_photo")
+                } | {"escalated": False})
+            if msg["is_photo"] and deps.get_file is not None:
+                stage = "send"
+                with trace.stage("send"):
+                    deps.get_file(msg["photo_file_id"])
+            if not msg["query_text"].strip():
+                status, reply = "missing_text", MISSING_TEXT_MESSAGE
+            else:
+                stage = "embed"
+                with trace.stage("embed"):
+                    vector = deps.embed(msg["query_text"])
+                if cache is not None:
+                    hit = cache.lookup(namespace, vector)
+                if hit is not None:
+                    status, reply = "answered", hit.answer
+                else:
+                    stage = "vector_query"
+                    with trace.stage("vector_query"):
+                        matches = deps.query(vector, namespace, top_k)
+                    chunk_ids = [m["id"] for m in matches if m.get("id")]
+                    stage = "llm"
+                    with trace.stage("llm"):
+                        answer = deps.chat(msg["query_text"], [_match_text(m) for m in matches])
+                    if (answer or ESCALATE).strip().upper() == ESCALATE:
+                        status, reply = "clarify", CLARIFY_MESSAGE
+                    else:
+                        status, reply = "answered", answer
+            stage = "send"
+            with trace.stage("send"):
+                deps.send(msg["chat_id"], reply)
+            trace.finish()
+            replied = True
+            if status == "clarify" and query_log_id is not None:
+                stage = "db"
+                with trace.stage("db"):
+                    deps.mark_clarification(query_log_id)
+        except Exception as e:
+            logger.exception("answer path failed at stage=%s update_id=%s", stage, msg["update_id"])
+            error_stage, error = stage, str(e)
+            if not replied:
+                status, reply = "error", ERROR_MESSAGE
+            # After the reply only the clarification mark can fail: the result keeps what the student received.
+            if not replied and stage != "send" and msg["chat_id"] is not None:
+                try:
+                    with trace.stage("send"):
+                        deps.send(msg["chat_id"], ERROR_MESSAGE)
+                    trace.finish()
+                except Exception:
+                    logger.exception("could not send the error reply for update_id=%s", msg["update_id"])
+    if deps.record_timings is not None:
+        try:
+            deps.record_timings(trace, institute_id, query_log_id)
+        except Exception:
+            logger.exception("could not record timings for update_id=%s", msg["update_id"])
+    # After the reply, off the request thread (and outside the trace, so audits don't count as vector_query time).
+    if cache is not None and vector is not None and status != "error":
+        _submit_after_reply(_after_reply_cache, cache, deps, msg, namespace, vector, hit, status, reply, chunk_ids, top_k)
+    return AnswerResult(
+        status=status, reply_text=reply, trace=trace, error_stage=error_stage, error=error, cached=hit is not None
+    )
+
+
+def _submit_after_reply(fn: Callable, *args) -> None:
+    global _after_reply_pool
+    with _after_reply_lock:
+        if _after_reply_pool is None:
+            _after_reply_pool = ThreadPoolExecutor(max_workers=AFTER_REPLY_WORKERS, thread_name_prefix="answer-after-reply")
+        fut = _after_reply_pool.submit(fn, *args)
+        _after_reply_pending.add(fut)
+    fut.add_done_callback(_after_reply_done)
+
+
+def _after_reply_done(fut: Future) -> None:
+    with _after_reply_lock:
+        _after_reply_pending.discard(fut)
+    if not fut.cancelled() and fut.exception() is not None:
+        logger.error("post-reply cache work failed", exc_info=fut.exception())
+
+
+def drain_after_reply(timeout: Optional[float] = None) -> bool:
+    """Wait for queued post-reply cache work (e.g. before reading AnswerCache stats). False on timeout."""
+    with _after_reply_lock:
+        pending = list(_after_reply_pending)
+    return not wait(pending, timeout=timeout).not_done
+
+
+def _after_reply_cache(cache, deps: AnswerDeps, msg: dict, namespace: str, vector, hit, status: str, reply: str,
+                       chunk_ids: list[str], top_k: int) -> None:
+    """Store a fresh answer, or audit a sampled hit by re-running retrieval; then log the cache event."""
+    overlap = suspect = None
+    if hit is None:
+        # Clarify replies are not cached: the next paraphrase should get a fresh attempt.
+        if status == "answered":
+            cache.store(namespace, msg["query_text"], vector, reply, chunk_ids)
+    elif cache.should_audit():
+        try:
+            fresh = deps.query(vector, namespace, top_k)
+            overlap, suspect = cache.audit(hit, [m["id"] for m in fresh if m.get("id")])
+        except Exception as e:
+            logger.warning("answer cache audit failed: %s", e)
+    cache.record_event(msg["institute_id"], hit, overlap, suspect)
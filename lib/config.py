@@ -2,8 +2,10 @@
 Environment config for MargAI Ghost Tutor pilot.
 Load from env; used by ingestion scripts and (via env) any hosting / n8n runtime.
 Loads pilot/.env when present (so scripts work from repo root).
+get_settings() is cached per process; call get_settings.cache_clear() after changing env in-process.
 """
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -27,6 +29,10 @@ class Settings(BaseSettings):
 
     # Gemini
     gemini_api_key: str = ""
+    # Host-wide Gemini requests/minute shared by all processes (lib.quota); 0 disables the broker.
+    gemini_rpm: int = 0
+    # SQLite file backing the quota broker (default: <tmpdir>/margai_gemini_quota.sqlite)
+    gemini_quota_db: str = ""
 
     # Telegram (for webhook)
     telegram_bot_token: str = ""
@@ -35,6 +41,16 @@ class Settings(BaseSettings):
     # Pilot: default institute when single-bot (chat_id -> institute_id mapping)
     institute_id_default: int = 1
 
+    # Extraction cache (lib.extraction_cache): per-page text keyed by PDF sha256 + extractor version
+    extraction_cache_dir: str = "~/.cache/margai/extraction"
+    extraction_cache_max_mb: int = 2048
+
+    # Semantic answer cache (lib.answer_cache): min cosine similarity for a hit, entries kept per namespace,
+    # share of hits audited by re-running retrieval
+    answer_cache_threshold: float = 0.95
+    answer_cache_max_entries: int = 5000
+    answer_cache_audit_rate: float = 0.05
+
     # Alert email for ingestion failures (optional)
     alert_email: Optional[str] = None
 
@@ -44,5 +60,6 @@ class Settings(BaseSettings):
     }
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     return Settings()
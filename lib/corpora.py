@@ -0,0 +1,75 @@
+"""
+Shared corpora: books (NCERT, standard texts) ingested once into a `shared-<slug>` Pinecone namespace
+that institutes subscribe to (005 migration), instead of one copy per institute namespace.
+lib.pinecone_client.query_index can search the institute namespace plus its subscriptions, but the production
+answer path (n8n telegram-webhook.json) queries only the institute namespace: until it queries shared namespaces
+too (SHARED_NAMESPACES_SERVED), ingest_pdf.py refuses --shared, since such a book would reach no student.
+Subscriptions are cached per process for SUBSCRIPTIONS_TTL_S so the lookup stays off the hot path.
+"""
+import logging
+import re
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SHARED_PREFIX = "shared-"
+SUBSCRIPTIONS_TTL_S = 60.0
+# Set to True once the production answer path queries subscribed shared namespaces.
+SHARED_NAMESPACES_SERVED = False
+
+_SLUG_RE = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+
+_cache: dict[int, tuple[float, list[str]]] = {}
+_cache_lock = threading.Lock()
+
+
+def shared_namespace(corpus_slug: str) -> str:
+    """Pinecone namespace of a shared corpus. Institute namespaces are str(institute_id), so they never collide."""
+    if not _SLUG_RE.match(corpus_slug):
+        raise ValueError(f"Invalid corpus slug {corpus_slug!r} (lowercase letters, digits, '-')")
+    return SHARED_PREFIX + corpus_slug
+
+
+def is_shared_namespace(namespace: str) -> bool:
+    return namespace.startswith(SHARED_PREFIX)
+
+
+def get_or_create_corpus(sb, corpus_slug: str, title: Optional[str] = None) -> int:
+    shared_namespace(corpus_slug)  # validate
+    r = sb.table("shared_corpora").select("id").eq("slug", corpus_slug).execute()
+    if r.data:
+        return int(r.data[0]["id"])
+    ins = sb.table("shared_corpora").insert({"slug": corpus_slug, "title": title}).execute()
+    if not ins.data:
+        raise RuntimeError(f"Failed to create shared corpus {corpus_slug!r}")
+    return int(ins.data[0]["id"])
+
+
+def subscribed_namespaces(sb, institute_id: int, refresh: bool = False) -> list[str]:
+    """Shared namespaces the institute subscribes to (cached for SUBSCRIPTIONS_TTL_S)."""
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(institute_id)
+    if hit is not None and not refresh and now - hit[0] < SUBSCRIPTIONS_TTL_S:
+        return hit[1]
+    rows = (
+        sb.table("institute_corpus_subscriptions")
+        .select("shared_corpora(slug)")
+        .eq("institute_id", institute_id)
+        .execute()
+        .data
+        or []
+    )
+    namespaces = sorted(shared_namespace(r["shared_corpora"]["slug"]) for r in rows if r.get("shared_corpora"))
+    with _cache_lock:
+        _cache[institute_id] = (now, namespaces)
+    return namespaces
+
+
+def corpus_slug_for_upload(sb, upload_id: str) -> Optional[str]:
+    """Corpus of an uploads row queued with --shared, or None for an institute upload."""
+    rows = sb.table("uploads").select("shared_corpora(slug)").eq("id", upload_id).execute().data or []
+    corpus = rows[0].get("shared_corpora") if rows else None
+    return corpus["slug"] if corpus else None
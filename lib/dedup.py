@@ -0,0 +1,178 @@
+"""
+Near-duplicate chunk elimination before embedding (running headers/footers, boilerplate boxes, reprinted editions).
+64-bit SimHash over word 3-shingles; near-duplicate = Hamming distance <= MAX_DISTANCE (banded lookup:
+MAX_DISTANCE + 1 bands, so any match within MAX_DISTANCE bits shares at least one band exactly).
+Exact duplicates via content hash.
+Duplicates are not embedded; they are recorded as aliases of the kept chunk in chunk_fingerprints (003 migration),
+which also holds the namespace's fingerprints so later ingests dedup against earlier PDFs.
+"""
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 3
+# For ~1000-char chunks a one-word edit moves 0–8 bits (mostly <= 6); unrelated chunks sit >= ~18 apart.
+MAX_DISTANCE = 6
+# Below this many shingles SimHash is too noisy; only exact duplicates are removed.
+MIN_SHINGLES = 8
+_PAGE_SIZE = 1000
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def content_hash(text: str) -> str:
+    """Hash of normalized tokens: catches exact duplicates that differ only in whitespace/case/punctuation."""
+    return hashlib.sha1(" ".join(_tokens(text)).encode()).hexdigest()
+
+
+def simhash64(text: str) -> Optional[int]:
+    """64-bit SimHash of word shingles; None when the text is too short for a stable fingerprint."""
+    toks = _tokens(text)
+    shingles = {" ".join(toks[i : i + SHINGLE_SIZE]) for i in range(len(toks) - SHINGLE_SIZE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    # Column-wise bit counts over the shingle hashes' binary strings (zip runs in C; no per-bit Python loop).
+    bits = [format(int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big"), "064b") for s in shingles]
+    half = len(bits) / 2
+    out = 0
+    for col in zip(*bits):
+        out = (out << 1) | (col.count("1") > half)
+    return out
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _band_slices(n_bands: int) -> list[tuple[int, int]]:
+    """(shift, mask) for n_bands contiguous bit ranges covering all 64 bits."""
+    base, extra = divmod(64, n_bands)
+    out, shift = [], 0
+    for b in range(n_bands):
+        width = base + (1 if b < extra else 0)
+        out.append((shift, (1 << width) - 1))
+        shift += width
+    return out
+
+
+class FingerprintIndex:
+    """Lookup of kept chunks by content hash (exact) and SimHash bands (near)."""
+
+    def __init__(self, max_distance: int = MAX_DISTANCE) -> None:
+        self.max_distance = max_distance
+        self._slices = _band_slices(max_distance + 1)
+        self._by_hash: dict[str, str] = {}
+        self._bands: list[dict[int, list[tuple[int, str]]]] = [{} for _ in self._slices]
+
+    def add(self, chunk_id: str, simhash: Optional[int], chash: str) -> None:
+        self._by_hash.setdefault(chash, chunk_id)
+        if simhash is None:
+            return
+        for band, (shift, mask) in zip(self._bands, self._slices):
+            band.setdefault((simhash >> shift) & mask, []).append((simhash, chunk_id))
+
+    def find(self, simhash: Optional[int], chash: str) -> Optional[str]:
+        """chunk_id of a kept duplicate, or None."""
+        hit = self._by_hash.get(chash)
+        if hit is not None or simhash is None:
+            return hit
+        for band, (shift, mask) in zip(self._bands, self._slices):
+            for other, chunk_id in band.get((simhash >> shift) & mask, ()):
+                if hamming(simhash, other) <= self.max_distance:
+                    return chunk_id
+        return None
+
+
+@dataclass
+class DedupResult:
+    kept: list[tuple[str, str]] = field(default_factory=list)
+    # duplicate chunk_id -> kept chunk_id (this PDF or an earlier one in the namespace)
+    aliases: dict[str, str] = field(default_factory=dict)
+    # chunk_id -> (simhash or None, content_hash), for every input chunk
+    fingerprints: dict[str, tuple[Optional[int], str]] = field(default_factory=dict)
+
+    @property
+    def saved(self) -> int:
+        """Embedding calls (and index vectors) avoided."""
+        return len(self.aliases)
+
+
+def dedup_chunks(
+    chunks: list[tuple[str, str]],
+    existing: Iterable[tuple[str, Optional[int], str]] = (),
+    max_distance: int = MAX_DISTANCE,
+) -> DedupResult:
+    """
+    chunks: (id, text) from chunk_with_ids. existing: (chunk_id, simhash, content_hash) already in the namespace.
+    Keeps the first occurrence; later near-duplicates become aliases.
+    """
+    index = FingerprintIndex(max_distance)
+    for chunk_id, sh, ch in existing:
+        index.add(chunk_id, sh, ch)
+    result = DedupResult()
+    for chunk_id, text in chunks:
+        sh, ch = simhash64(text), content_hash(text)
+        result.fingerprints[chunk_id] = (sh, ch)
+        canonical = index.find(sh, ch)
+        if canonical is not None and canonical != chunk_id:
+            result.aliases[chunk_id] = canonical
+            continue
+        index.add(chunk_id, sh, ch)
+        result.kept.append((chunk_id, text))
+    logger.info(
+        "dedup: chunks=%s kept=%s duplicates=%s (embeddings saved)",
+        len(chunks), len(result.kept), result.saved,
+    )
+    return result
+
+
+def _to_hex(simhash: Optional[int]) -> Optional[str]:
+    return None if simhash is None else format(simhash, "016x")
+
+
+def load_namespace_fingerprints(sb, namespace: str, exclude_source: Optional[str] = None) -> list[tuple[str, Optional[int], str]]:
+    """
+    Kept-chunk fingerprints for a namespace. exclude_source: skip a file's own rows on re-ingest.
+    Keyset-paged on the primary key (namespace, chunk_id): offset pages without an ORDER BY can skip or repeat rows.
+    """
+    rows: list[dict] = []
+    last: Optional[str] = None
+    while True:
+        q = sb.table("chunk_fingerprints").select("chunk_id,simhash,content_hash,source_file").eq("namespace", namespace).is_("alias_of", "null")
+        if last is not None:
+            q = q.gt("chunk_id", last)
+        page = q.order("chunk_id").limit(_PAGE_SIZE).execute().data or []
+        rows.extend(page)
+        if len(page) < _PAGE_SIZE:
+            break
+        last = page[-1]["chunk_id"]
+    return [
+        (r["chunk_id"], int(r["simhash"], 16) if r.get("simhash") else None, r["content_hash"])
+        for r in rows
+        if not exclude_source or r.get("source_file") != exclude_source
+    ]
+
+
+def save_fingerprints(sb, namespace: str, source_file: str, result: DedupResult) -> None:
+    """Upsert fingerprints for every chunk of this PDF (aliases carry alias_of)."""
+    rows = [
+        {
+            "namespace": namespace,
+            "chunk_id": chunk_id,
+            "source_file": source_file,
+            "simhash": _to_hex(sh),
+            "content_hash": ch,
+            "alias_of": result.aliases.get(chunk_id),
+        }
+        for chunk_id, (sh, ch) in result.fingerprints.items()
+    ]
+    for i in range(0, len(rows), _PAGE_SIZE):
+        sb.table("chunk_fingerprints").upsert(rows[i : i + _PAGE_SIZE], on_conflict="namespace,chunk_id").execute()
@@ -1,13 +1,18 @@
 """
 Gemini embedding API: one vector per chunk; dimension 3072 for Pinecone index.
 Uses models/gemini-embedding-001 with output_dimensionality=3072.
-Retries on 429 (quota/rate limit) with exponential backoff.
+Retries on 429 (quota/rate limit) with exponential backoff, or the server's retry delay when given.
+Requests go through the host-wide quota broker (lib.quota) when GEMINI_RPM is set:
+get_embedding = "interactive" priority, get_embeddings_batch = "ingest".
+google.generativeai is imported and configured once per process (per API key), on first use.
 """
 import logging
 import time
-from typing import List
+from typing import List, Optional
 
-import google.generativeai as genai
+from lib.ingest_metrics import incr
+from lib.quota import PRIORITY_INGEST, PRIORITY_INTERACTIVE, get_broker, retry_delay_from_error
+from lib.timing import trace_stage
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +27,26 @@ _BACKOFF_429 = 2.0
 # Small delay between batch items to avoid rate limit (seconds).
 _DELAY_BETWEEN_EMBEDS = 0.3
 
+_genai = None
+_configured_key: Optional[str] = None
+
+
+def _client(api_key: str):
+    """Import google.generativeai lazily and (re)configure only when the API key changes."""
+    global _genai, _configured_key
+    if _genai is None:
+        import google.generativeai as genai
+
+        _genai = genai
+    if api_key != _configured_key:
+        _genai.configure(api_key=api_key)
+        _configured_key = api_key
+    return _genai
+
 
 def _embed_one(model: str, content: str):
     """Single embed_content call. Raises on failure."""
-    return genai.embed_content(
+    return _genai.embed_content(
         model=model,
         content=content,
         output_dimensionality=EMBEDDING_DIMENSION,
@@ -43,23 +64,34 @@ def _is_rate_limit(exc: Exception) -> bool:
         return False
 
 
-def _call_with_429_retry(model: str, content: str):
-    """Call _embed_one with retries on 429 (ResourceExhausted)."""
+def _call_with_429_retry(model: str, content: str, priority: str = PRIORITY_INTERACTIVE):
+    """Call _embed_one with retries on 429 (ResourceExhausted). Waits for the quota broker before each attempt."""
+    broker = get_broker()
     delay = _INITIAL_DELAY_429
     last_exc = None
     for attempt in range(_MAX_RETRIES_429):
+        if broker is not None:
+            broker.acquire(priority)
         try:
-            return _embed_one(model, content)
+            result = _embed_one(model, content)
+            incr("embeds")
+            return result
         except Exception as e:
             last_exc = e
             if _is_rate_limit(e) and attempt < _MAX_RETRIES_429 - 1:
+                server_delay = retry_delay_from_error(e)
+                wait = server_delay if server_delay is not None else delay
                 logger.warning(
                     "Embedding rate limited (429), retrying in %.1fs (attempt %d/%d)",
-                    delay,
+                    wait,
                     attempt + 1,
                     _MAX_RETRIES_429,
                 )
-                time.sleep(delay)
+                incr("embed_retries_429")
+                incr("embed_backoff_sleep_s", wait)
+                if broker is not None and server_delay is not None:
+                    broker.block_for(server_delay)
+                time.sleep(wait)
                 delay *= _BACKOFF_429
                 continue
             raise
@@ -73,11 +105,13 @@ def get_embedding(
     api_key: str,
     model: str = EMBEDDING_MODEL,
     task_type: str = "retrieval_document",
+    priority: str = PRIORITY_INTERACTIVE,
 ) -> List[float]:
     """Embed a single text. task_type kept for call-site compatibility but not sent to Gemini API."""
-    genai.configure(api_key=api_key)
+    _client(api_key)
     try:
-        result = _call_with_429_retry(model, text)
+        with trace_stage("embed"):
+            result = _call_with_429_retry(model, text, priority)
         return result["embedding"]
     except Exception as e:
         logger.exception("embed_content failed for model=%s", model)
@@ -89,17 +123,21 @@ def get_embeddings_batch(
     api_key: str,
     model: str = EMBEDDING_MODEL,
     batch_size: int = 100,
+    priority: str = PRIORITY_INGEST,
 ) -> List[List[float]]:
-    """Embed multiple texts. Processes in batches. Retries on 429 with backoff."""
-    genai.configure(api_key=api_key)
+    """Embed multiple texts. Processes in batches. Retries on 429 with backoff.
+    With the quota broker enabled, pacing comes from the shared bucket instead of the fixed inter-call delay."""
+    _client(api_key)
+    paced_by_broker = get_broker() is not None
     all_embeddings: List[List[float]] = []
     for i in range(0, len(texts), batch_size):
         batch = texts[i : i + batch_size]
         for j, t in enumerate(batch):
-            if j > 0:
+            if j > 0 and not paced_by_broker:
+                incr("embed_delay_sleep_s", _DELAY_BETWEEN_EMBEDS)
                 time.sleep(_DELAY_BETWEEN_EMBEDS)
             try:
-                result = _call_with_429_retry(model, t)
+                result = _call_with_429_retry(model, t, priority)
                 all_embeddings.append(result["embedding"])
             except Exception as e:
                 logger.exception("embed_content failed for batch item (model=%s)", model)
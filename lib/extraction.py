@@ -0,0 +1,229 @@
+"""
+PDF text extraction shared by the ingest scripts: upsc-test-engine hybrid, minimal PyMuPDF, or parallel.
+Parallel page-range mode (PyMuPDF) for large / scanned books: pages are sharded across a process pool; each worker opens the PDF itself.
+OCR-likely pages (images and little or no native text) run first, one page per task, since they dominate wall time;
+native pages follow in contiguous ranges. Results come back in page order with per-page timing.
+"""
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Native text shorter than this on a page with images → OCR the page.
+OCR_MIN_CHARS = 50
+OCR_DPI = 300
+OCR_LANGUAGE = "eng"
+# Pages per native-text task (small enough to balance, large enough to amortise opening the PDF).
+NATIVE_RANGE_SIZE = 16
+# Bump when extraction output changes (OCR settings, heuristics) so cached text is not reused.
+EXTRACTOR_VERSION = 1
+
+
+@dataclass
+class PageResult:
+    page: int
+    text: str
+    seconds: float
+    method: str  # "native" | "ocr" | "ocr_failed" | "hybrid"
+
+
+@dataclass
+class ExtractionResult:
+    text: str
+    page_count: int
+    pages: list[PageResult] = field(default_factory=list)
+    error: Optional[str] = None
+    cached: bool = False
+
+    @property
+    def ocr_pages(self) -> int:
+        return sum(1 for p in self.pages if p.method in ("ocr", "ocr_failed"))
+
+    def slowest(self, n: int = 10) -> list[PageResult]:
+        return sorted(self.pages, key=lambda p: p.seconds, reverse=True)[:n]
+
+
+def _needs_ocr(page) -> bool:
+    """
+    Same rule as _extract_page, checked up front for scheduling: images and < OCR_MIN_CHARS of native text.
+    Native text is only read for pages that have images and fonts (image-free pages never OCR; font-free pages always do).
+    """
+    if not page.get_images():
+        return False
+    if not page.get_fonts():
+        return True
+    return len(page.get_text().strip()) < OCR_MIN_CHARS
+
+
+def _extract_page(page, index: int, force_ocr: bool) -> PageResult:
+    t0 = time.perf_counter()
+    text = "" if force_ocr else page.get_text()
+    method = "native"
+    if force_ocr or (len(text.strip()) < OCR_MIN_CHARS and page.get_images()):
+        try:
+            tp = page.get_textpage_ocr(dpi=OCR_DPI, language=OCR_LANGUAGE, full=True)
+            text = page.get_text(textpage=tp)
+            method = "ocr"
+        except Exception as e:  # Tesseract missing or page render failure: keep native text
+            logger.warning("OCR failed for page %s: %s", index + 1, e)
+            text = text or page.get_text()
+            method = "ocr_failed"
+    return PageResult(page=index, text=text, seconds=time.perf_counter() - t0, method=method)
+
+
+def _extract_pages(file_path: str, pages: list[int], force_ocr: bool) -> list[PageResult]:
+    """Worker: open the PDF independently and extract the given pages."""
+    import pymupdf
+
+    doc = pymupdf.open(file_path)
+    try:
+        return [_extract_page(doc[i], i, force_ocr) for i in pages]
+    finally:
+        doc.close()
+
+
+def plan_tasks(doc) -> list[tuple[list[int], bool]]:
+    """(pages, force_ocr) tasks: OCR-likely single pages first, then native ranges."""
+    ocr = [i for i in range(len(doc)) if _needs_ocr(doc[i])]
+    ocr_set = set(ocr)
+    native = [i for i in range(len(doc)) if i not in ocr_set]
+    tasks: list[tuple[list[int], bool]] = [([i], True) for i in ocr]
+    for start in range(0, len(native), NATIVE_RANGE_SIZE):
+        tasks.append((native[start : start + NATIVE_RANGE_SIZE], False))
+    return tasks
+
+
+def extract_parallel(file_path: Path, workers: Optional[int] = None) -> ExtractionResult:
+    """
+    Extract all pages of file_path using up to `workers` processes (default: CPU count).
+    Returns text joined in page order; error set on failure (mirrors the scripts' extract_text contract).
+    """
+    import pymupdf
+
+    try:
+        doc = pymupdf.open(file_path)
+        try:
+            page_count = len(doc)
+            tasks = plan_tasks(doc)
+        finally:
+            doc.close()
+    except Exception as e:
+        return ExtractionResult(text="", page_count=0, error=str(e))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    results: list[PageResult] = []
+    try:
+        if workers == 1:
+            for pages, force_ocr in tasks:
+                results.extend(_extract_pages(str(file_path), pages, force_ocr))
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_extract_pages, str(file_path), pages, force_ocr) for pages, force_ocr in tasks]
+                for fut in as_completed(futures):
+                    results.extend(fut.result())
+    except Exception as e:
+        return ExtractionResult(text="", page_count=page_count, error=str(e))
+
+    results.sort(key=lambda r: r.page)
+    text = "\n\n".join(r.text for r in results).strip()
+    out = ExtractionResult(text=text, page_count=page_count, pages=results)
+    logger.info(
+        "parallel extraction: pages=%s ocr_pages=%s workers=%s total_chars=%s",
+        page_count, out.ocr_pages, workers, len(text),
+    )
+    for r in out.slowest(5):
+        logger.info("  slow page %s: %.2fs (%s)", r.page + 1, r.seconds, r.method)
+    return out
+
+
+def _extract_minimal(file_path: Path) -> ExtractionResult:
+    """Native text only, page by page (no OCR)."""
+    try:
+        import pymupdf
+        doc = pymupdf.open(file_path)
+        try:
+            pages = []
+            for i in range(len(doc)):
+                t0 = time.perf_counter()
+                pages.append(PageResult(page=i, text=doc[i].get_text(), seconds=time.perf_counter() - t0, method="native"))
+            text = "\n\n".join(p.text for p in pages)
+            return ExtractionResult(text=text.strip(), page_count=len(doc), pages=pages)
+        finally:
+            doc.close()
+    except Exception as e:
+        return ExtractionResult(text="", page_count=0, error=str(e))
+
+
+def _hybrid_available() -> bool:
+    try:
+        from app.services.pdf_extraction_service import extract_hybrid  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=1)
+def _hybrid_version() -> str:
+    """
+    Short sha256 of upsc-test-engine's extraction service package (every .py next to pdf_extraction_service),
+    so any change there, committed or not, produces a new cache key.
+    """
+    from app.services import pdf_extraction_service
+
+    h = hashlib.sha256()
+    for path in sorted(Path(pdf_extraction_service.__file__).resolve().parent.glob("*.py")):
+        h.update(path.name.encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()[:12]
+
+
+def extractor_id(workers: int = 0) -> str:
+    """
+    Identifies which extractor (and version) produced a text; part of the extraction cache key.
+    Hybrid ids include the upsc-test-engine source hash (its code lives outside this repo's EXTRACTOR_VERSION).
+    """
+    if workers > 0:
+        return f"parallel-v{EXTRACTOR_VERSION}"
+    if _hybrid_available():
+        return f"hybrid-v{EXTRACTOR_VERSION}-{_hybrid_version()}"
+    return f"pymupdf-v{EXTRACTOR_VERSION}"
+
+
+def extract_document(file_path: Path, workers: int = 0) -> ExtractionResult:
+    """
+    Extract text using upsc-test-engine hybrid extraction when available, else minimal PyMuPDF.
+    workers > 0: shard pages across a process pool instead (extract_parallel).
+    extract_hybrid only returns the joined document text (no per-page output), so its result has a single
+    PageResult covering the whole document; per-page text/timing needs workers > 0 or the PyMuPDF fallback.
+    """
+    if workers > 0:
+        return extract_parallel(file_path, workers=workers)
+    t0 = time.perf_counter()
+    try:
+        from app.services.pdf_extraction_service import extract_hybrid
+    except ImportError:
+        logger.warning("upsc-test-engine not found; using minimal PyMuPDF extraction")
+        return _extract_minimal(file_path)
+
+    try:
+        result = extract_hybrid(file_path)
+    except Exception as e:
+        return ExtractionResult(text="", page_count=0, error=str(e))
+    # Observability: log extraction outcome (chars, page count)
+    logger.info(
+        "extraction outcome: total_chars=%s page_count=%s is_valid=%s",
+        len(result.text), result.page_count, result.is_valid,
+    )
+    text = result.text or ""
+    pages = [PageResult(page=0, text=text, seconds=time.perf_counter() - t0, method="hybrid")]
+    if not result.is_valid:
+        return ExtractionResult(text=text, page_count=result.page_count, pages=pages, error=result.error_message or "Extraction failed")
+    return ExtractionResult(text=text, page_count=result.page_count, pages=pages)
@@ -0,0 +1,178 @@
+"""
+On-disk extraction cache: key = sha256(PDF bytes) + extractor id (lib.extraction.extractor_id; hybrid ids
+include the upsc-test-engine source hash). Re-ingesting an unchanged PDF (new CHUNK_SIZE/OVERLAP, heading
+regexes, metadata) skips extraction/OCR.
+One file per entry: magic, JSON header (segment offsets + extraction method), then one zlib-compressed blob per
+segment. Parallel / PyMuPDF entries have one segment per page, so CachedExtraction.page(i) decompresses only that
+page; hybrid extraction has no per-page output, so its entries are a single whole-document segment.
+Ingest chunks the whole text, so extract_cached reads every segment (once). Size-bounded; LRU eviction.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional
+
+from lib.extraction import ExtractionResult, PageResult, extract_document, extractor_id
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"MGXC1\n"
+_SUFFIX = ".mgxc"
+_ZLIB_LEVEL = 6
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class CachedExtraction:
+    """Lazy view over one cache entry; pages are decompressed on access."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"Not an extraction cache file: {path}")
+            (header_len,) = struct.unpack(">I", f.read(4))
+            header = json.loads(f.read(header_len))
+        self._data_start = len(_MAGIC) + 4 + header_len
+        self.page_count: int = header["page_count"]
+        self.extractor: str = header["extractor"]
+        self._segments: list[tuple[int, int]] = [tuple(s) for s in header["segments"]]
+        self.methods: list[str] = header.get("methods") or ["native"] * len(self._segments)
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def page(self, i: int) -> str:
+        offset, length = self._segments[i]
+        with open(self.path, "rb") as f:
+            f.seek(self._data_start + offset)
+            return zlib.decompress(f.read(length)).decode("utf-8")
+
+    def iter_pages(self) -> Iterator[str]:
+        with open(self.path, "rb") as f:
+            for offset, length in self._segments:
+                f.seek(self._data_start + offset)
+                yield zlib.decompress(f.read(length)).decode("utf-8")
+
+    def text(self) -> str:
+        """Joined text, same shape as the extractors return."""
+        return "\n\n".join(self.iter_pages()).strip()
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.max_bytes = max_bytes
+
+    def _path(self, digest: str, extractor: str) -> Path:
+        return self.cache_dir / f"{digest}-{extractor}{_SUFFIX}"
+
+    def get(self, digest: str, extractor: str) -> Optional[CachedExtraction]:
+        path = self._path(digest, extractor)
+        if not path.exists():
+            return None
+        try:
+            entry = CachedExtraction(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Dropping unreadable extraction cache entry %s: %s", path, e)
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)  # LRU: mtime = last use
+        return entry
+
+    def put(
+        self, digest: str, extractor: str, pages: list[str], page_count: int, methods: Optional[list[str]] = None
+    ) -> Path:
+        """Store segment texts (one per page, or one per document for hybrid); atomic write, then evict to max_bytes."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        blobs = [zlib.compress(p.encode("utf-8"), _ZLIB_LEVEL) for p in pages]
+        segments, offset = [], 0
+        for b in blobs:
+            segments.append([offset, len(b)])
+            offset += len(b)
+        header = json.dumps(
+            {
+                "sha256": digest,
+                "extractor": extractor,
+                "page_count": page_count,
+                "segments": segments,
+                "methods": methods or ["native"] * len(pages),
+            },
+            separators=(",", ":"),
+        ).encode()
+        path = self._path(digest, extractor)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack(">I", len(header)))
+            f.write(header)
+            for b in blobs:
+                f.write(b)
+        os.replace(tmp, path)
+        logger.info("Extraction cached: %s (%s pages, %s bytes)", path.name, len(pages), path.stat().st_size)
+        self.evict()
+        return path
+
+    def evict(self) -> int:
+        """Delete least-recently-used entries until total size <= max_bytes. Returns entries removed."""
+        entries = []
+        for p in self.cache_dir.glob(f"*{_SUFFIX}"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+            logger.info("Evicted extraction cache entry %s", p.name)
+        return removed
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Cache from settings (EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_MB)."""
+    from lib.config import get_settings
+
+    settings = get_settings()
+    return ExtractionCache(Path(settings.extraction_cache_dir), max_bytes=settings.extraction_cache_max_mb * 1024**2)
+
+
+def extract_cached(file_path: Path, workers: int = 0, cache: Optional[ExtractionCache] = None) -> ExtractionResult:
+    """
+    extract_document() behind the cache. Failed extractions are never cached, nor are results with ocr_failed pages
+    (Tesseract missing, page render error): their short text would be served until EXTRACTOR_VERSION changes.
+    """
+    if cache is None:
+        return extract_document(file_path, workers=workers)
+    extractor = extractor_id(workers)
+    digest = file_sha256(file_path)
+    hit = cache.get(digest, extractor)
+    if hit is not None:
+        pages = [
+            PageResult(page=i, text=t, seconds=0.0, method=hit.methods[i]) for i, t in enumerate(hit.iter_pages())
+        ]
+        text = "\n\n".join(p.text for p in pages).strip()
+        logger.info("extraction cache hit: sha256=%s extractor=%s pages=%s chars=%s", digest[:12], extractor, hit.page_count, len(text))
+        return ExtractionResult(text=text, page_count=hit.page_count, pages=pages, cached=True)
+    result = extract_document(file_path, workers=workers)
+    if any(p.method == "ocr_failed" for p in result.pages):
+        logger.warning("extraction not cached: OCR failed on some pages of %s", file_path.name)
+    elif not result.error and result.pages:
+        cache.put(digest, extractor, [p.text for p in result.pages], result.page_count, [p.method for p in result.pages])
+    return result
@@ -0,0 +1,180 @@
+"""
+Structured ingest metrics: per-stage wall time, counters (chunks, embeds, 429 retries, sleeps, bytes upserted), peak RSS.
+Emitted as a JSON summary and a Prometheus textfile (node_exporter textfile collector).
+lib.embedding / lib.pinecone_client increment counters on the active IngestMetrics (no-op when none is active).
+Optional cProfile dump per stage (<profile_dir>/<stage>.prof; inspect with `python -m pstats`).
+"""
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Counter names; unknown names are rejected so typos don't silently vanish.
+COUNTERS = (
+    "pages",
+    "ocr_pages",
+    "chars",
+    "chunks",
+    "chunks_deduped",
+    "embeds",
+    "embed_retries_429",
+    "embed_backoff_sleep_s",
+    "embed_delay_sleep_s",
+    "vectors_upserted",
+    "bytes_upserted",
+)
+
+_current_metrics: contextvars.ContextVar[Optional["IngestMetrics"]] = contextvars.ContextVar(
+    "margai_ingest_metrics", default=None
+)
+
+
+def _maxrss_bytes(who: int) -> int:
+    """ru_maxrss in bytes (KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return int(peak) if sys.platform == "darwin" else int(peak) * 1024
+
+
+def _peak_rss_bytes() -> int:
+    """
+    Peak RSS of this process plus the largest finished child (--workers extraction pool).
+    RUSAGE_CHILDREN only reports the biggest reaped child, so with N workers this is a lower bound.
+    """
+    return _maxrss_bytes(resource.RUSAGE_SELF) + _maxrss_bytes(resource.RUSAGE_CHILDREN)
+
+
+class IngestMetrics:
+    """Per-ingest stage timings + counters. Use as the active metrics via activate()."""
+
+    def __init__(self, labels: Optional[dict[str, str]] = None, profile_dir: Optional[Path] = None) -> None:
+        self.labels = dict(labels or {})
+        self.profile_dir = profile_dir
+        self.stages_s: dict[str, float] = {}
+        self.counters: dict[str, float] = {name: 0 for name in COUNTERS}
+        self.status = "running"
+        self._started = time.perf_counter()
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        if name not in self.counters:
+            raise ValueError(f"Unknown ingest counter {name!r}; expected one of {COUNTERS}")
+        self.counters[name] += amount
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as stage `name`; dump cProfile stats when profile_dir is set."""
+        profiler = cProfile.Profile() if self.profile_dir else None
+        t0 = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            self.stages_s[name] = self.stages_s.get(name, 0.0) + (time.perf_counter() - t0)
+            if profiler:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                out = self.profile_dir / f"{name}.prof"
+                profiler.dump_stats(str(out))
+                logger.info("cProfile for stage=%s written to %s", name, out)
+
+    def summary(self) -> dict:
+        """JSON-serialisable summary: wall time, stages, counters and derived rates."""
+        wall = time.perf_counter() - self._started
+        chunk_s = self.stages_s.get("chunk", 0.0)
+        embed_s = self.stages_s.get("embed", 0.0)
+        return {
+            "status": self.status,
+            "labels": self.labels,
+            "wall_time_s": round(wall, 3),
+            "stages_s": {k: round(v, 3) for k, v in self.stages_s.items()},
+            "counters": {k: round(v, 3) if isinstance(v, float) else v for k, v in self.counters.items()},
+            "chunks_per_s": round(self.counters["chunks"] / chunk_s, 2) if chunk_s > 0 else None,
+            "embeds_per_s": round(self.counters["embeds"] / embed_s, 2) if embed_s > 0 else None,
+            "peak_rss_bytes": _peak_rss_bytes(),
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (gauges; one sample set per ingest run)."""
+        s = self.summary()
+        base = ",".join(f'{k}="{_escape_label(v)}"' for k, v in sorted(self.labels.items()))
+
+        def labels(extra: str = "") -> str:
+            parts = [p for p in (base, extra) if p]
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = [
+            "# HELP margai_ingest_success 1 if the last ingest completed, else 0.",
+            "# TYPE margai_ingest_success gauge",
+            f"margai_ingest_success{labels()} {1 if s['status'] == 'completed' else 0}",
+            "# HELP margai_ingest_wall_seconds Wall time of the last ingest.",
+            "# TYPE margai_ingest_wall_seconds gauge",
+            f"margai_ingest_wall_seconds{labels()} {s['wall_time_s']}",
+            "# HELP margai_ingest_stage_seconds Wall time per ingest stage.",
+            "# TYPE margai_ingest_stage_seconds gauge",
+        ]
+        for stage, secs in s["stages_s"].items():
+            stage_label = f'stage="{_escape_label(stage)}"'
+            lines.append(f"margai_ingest_stage_seconds{labels(stage_label)} {secs}")
+        for name, value in s["counters"].items():
+            lines.extend([
+                f"# TYPE margai_ingest_{name} gauge",
+                f"margai_ingest_{name}{labels()} {value}",
+            ])
+        lines.extend([
+            "# TYPE margai_ingest_peak_rss_bytes gauge",
+            f"margai_ingest_peak_rss_bytes{labels()} {s['peak_rss_bytes']}",
+        ])
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path: Optional[Path] = None, prom_path: Optional[Path] = None) -> dict:
+        """Log the JSON summary; optionally write it and the Prometheus textfile (atomic rename)."""
+        s = self.summary()
+        logger.info("ingest metrics: %s", json.dumps(s, sort_keys=True))
+        if json_path:
+            write_atomic(json_path, json.dumps(s, indent=2, sort_keys=True) + "\n")
+        if prom_path:
+            write_atomic(prom_path, self.to_prometheus())
+        return s
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def write_atomic(path: Path, content: str) -> None:
+    """Write via tmp + rename so textfile collectors never read a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(content, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+@contextmanager
+def activate(metrics: IngestMetrics) -> Iterator[IngestMetrics]:
+    """Make `metrics` the active IngestMetrics for the enclosed block."""
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+def current_metrics() -> Optional[IngestMetrics]:
+    return _current_metrics.get()
+
+
+def incr(name: str, amount: float = 1) -> None:
+    """Increment a counter on the active IngestMetrics; no-op when none is active."""
+    m = _current_metrics.get()
+    if m is not None:
+        m.incr(name, amount)
@@ -0,0 +1,113 @@
+"""
+Ingest job queue on the uploads table (004 migration): claim / heartbeat / fail / stats.
+Same SQL functions behind two backends: Supabase (PostgREST RPC) for production and a direct
+Postgres DSN (psycopg, optional dependency) for testing against a local Postgres.
+"""
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UploadJob:
+    id: str
+    institute_id: int
+    institute_slug: str
+    file_path: str
+    filename: str
+    attempts: int
+    created_at: str
+
+
+class UploadQueue(ABC):
+    """Backend-agnostic queue operations; subclasses implement _call (SQL function) and _select_stats."""
+
+    def __init__(self, worker_id: str) -> None:
+        self.worker_id = worker_id
+
+    @abstractmethod
+    def _call(self, fn: str, params: dict):
+        """Run SQL function `fn` with named params; rows as dicts (or a bare scalar)."""
+
+    @abstractmethod
+    def _select_stats(self) -> list[dict]:
+        """Rows of the ingest_queue_stats view."""
+
+    def claim(self, max_per_institute: int = 1, stale_after_s: int = 600, max_attempts: int = 3) -> Optional[UploadJob]:
+        rows = self._call("claim_upload", {
+            "p_worker_id": self.worker_id,
+            "p_max_per_institute": max_per_institute,
+            "p_stale_after_s": stale_after_s,
+            "p_max_attempts": max_attempts,
+        })
+        if not rows:
+            return None
+        r = rows[0]
+        return UploadJob(
+            id=str(r["id"]),
+            institute_id=int(r["institute_id"]),
+            institute_slug=r["institute_slug"],
+            file_path=r["file_path"],
+            filename=r["filename"],
+            attempts=int(r["attempts"]),
+            created_at=str(r["created_at"]),
+        )
+
+    def heartbeat(self, upload_ids: list[str]) -> list[str]:
+        """Refresh heartbeats; returns the ids this worker no longer owns (their ingests must be stopped)."""
+        if not upload_ids:
+            return []
+        rows = self._call("heartbeat_uploads", {"p_worker_id": self.worker_id, "p_ids": upload_ids}) or []
+        return [str(r["lost_id"]) for r in rows]
+
+    def fail_if_processing(self, upload_id: str, error: str) -> bool:
+        return bool(_scalar(self._call("fail_upload_if_processing", {
+            "p_worker_id": self.worker_id, "p_id": upload_id, "p_error": error,
+        })))
+
+    def stats(self) -> list[dict]:
+        """Rows of ingest_queue_stats: institute_id, queued, processing, oldest_queued_s, avg_wait_s_24h, avg_run_s_24h."""
+        return self._select_stats()
+
+
+def _scalar(result):
+    """RPC scalars come back bare (PostgREST) or as a single-row/column list (psycopg)."""
+    if isinstance(result, list):
+        if not result:
+            return None
+        first = result[0]
+        return next(iter(first.values())) if isinstance(first, dict) else first
+    return result
+
+
+class SupabaseQueue(UploadQueue):
+    def __init__(self, sb, worker_id: str) -> None:
+        super().__init__(worker_id)
+        self.sb = sb
+
+    def _call(self, fn: str, params: dict):
+        return self.sb.rpc(fn, params).execute().data
+
+    def _select_stats(self) -> list[dict]:
+        return self.sb.table("ingest_queue_stats").select("*").execute().data or []
+
+
+class PostgresQueue(UploadQueue):
+    """Direct Postgres backend (pip install psycopg). Each call is its own transaction."""
+
+    def __init__(self, dsn: str, worker_id: str) -> None:
+        super().__init__(worker_id)
+        import psycopg
+        from psycopg.rows import dict_row
+
+        self.conn = psycopg.connect(dsn, autocommit=True, row_factory=dict_row)
+
+    def _call(self, fn: str, params: dict):
+        args = ", ".join(f"{k} => %({k})s" for k in params)
+        return self.conn.execute(f"SELECT * FROM {fn}({args})", params).fetchall()
+
+    def _select_stats(self) -> list[dict]:
+        return self.conn.execute("SELECT * FROM ingest_queue_stats ORDER BY institute_id").fetchall()
@@ -1,23 +1,49 @@
 """
 Pinecone upsert and query with namespace = institute_id.
-One namespace per institute for multi-tenancy.
+One namespace per institute for multi-tenancy, plus shared-corpus namespaces (lib.corpora) that
+query_index searches alongside the institute's own (concurrently, merged by score, duplicate passages dropped).
+pinecone is imported on first use; index handles are cached per process (api_key, index_name).
 """
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence
 
-from pinecone import Pinecone
+from lib.dedup import content_hash
+from lib.ingest_metrics import current_metrics
+from lib.timing import trace_stage
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def _pinecone_client(api_key: str):
+    from pinecone import Pinecone
+
+    return Pinecone(api_key=api_key)
+
+
+@lru_cache(maxsize=None)
 def get_pinecone_index(api_key: str, index_name: str):
-    """Return Pinecone index handle. Assumes index already exists (create via console or docs)."""
-    pc = Pinecone(api_key=api_key)
-    return pc.Index(index_name)
+    """Return Pinecone index handle (cached per process). Assumes index already exists (create via console or docs)."""
+    return _pinecone_client(api_key).Index(index_name)
 
 
 # Pinecone request payload limit ~4 MB; batch to stay under it (e.g. 80 vectors per batch for 3072-dim + metadata).
 UPSERT_BATCH_SIZE = 80
+# Average JSON size of one embedding value (e.g. "-0.0123456789012345, "), for the bytes_upserted estimate.
+_JSON_BYTES_PER_FLOAT = 22
+# Per-record JSON overhead: keys, braces, quotes around id.
+_JSON_RECORD_OVERHEAD = 48
+
+
+def _estimate_payload_bytes(batch: list[dict]) -> int:
+    """Approximate request body size: floats x _JSON_BYTES_PER_FLOAT + metadata + id (no json.dumps of the vectors)."""
+    total = 0
+    for r in batch:
+        total += len(r["values"]) * _JSON_BYTES_PER_FLOAT + len(r["id"]) + _JSON_RECORD_OVERHEAD
+        total += sum(len(str(k)) + len(str(v)) + 6 for k, v in r["metadata"].items())
+    return total
 
 
 def upsert_vectors(
@@ -37,25 +63,87 @@ def upsert_vectors(
         {"id": vid, "values": vec, "metadata": meta or {}}
         for vid, vec, meta in vectors
     ]
+    metrics = current_metrics()
     for i in range(0, len(records), UPSERT_BATCH_SIZE):
         batch = records[i : i + UPSERT_BATCH_SIZE]
         index.upsert(vectors=batch, namespace=namespace)
+        if metrics is not None:
+            metrics.incr("vectors_upserted", len(batch))
+            metrics.incr("bytes_upserted", _estimate_payload_bytes(batch))
     logger.info("Upserted %s vectors to namespace=%s (batches of %s)", len(records), namespace, UPSERT_BATCH_SIZE)
 
 
+def _field(obj, name: str, default=None):
+    return obj.get(name, default) if isinstance(obj, dict) else getattr(obj, name, default)
+
+
+def merge_matches(results: Sequence[tuple[str, object]], top_k: int) -> list[dict]:
+    """
+    results: (namespace, query response) pairs. Returns the top_k matches across namespaces by score,
+    as dicts {id, score, metadata, namespace}. Scores are comparable: same index, same metric.
+    A passage found in several namespaces (same book ingested by the institute and in a shared corpus)
+    is kept once, at its best score; passages are compared by lib.dedup.content_hash of metadata "text".
+    """
+    merged: list[dict] = []
+    for ns, res in results:
+        for m in _field(res, "matches", None) or []:
+            merged.append({
+                "id": _field(m, "id"),
+                "score": float(_field(m, "score", 0.0) or 0.0),
+                "metadata": _field(m, "metadata", None) or {},
+                "namespace": ns,
+            })
+    merged.sort(key=lambda m: m["score"], reverse=True)
+    out: list[dict] = []
+    seen: set = set()
+    for m in merged:
+        text = m["metadata"].get("text")
+        key = content_hash(text) if text else (m["namespace"], m["id"])
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(m)
+        if len(out) == top_k:
+            break
+    return out
+
+
 def query_index(
     index,
     vector: List[float],
     namespace: str,
     top_k: int = 10,
     include_metadata: bool = True,
+    shared_namespaces: Optional[Sequence[str]] = None,
 ):
     """
-    Query Pinecone in the given namespace. Returns matches with scores and metadata.
+    Query Pinecone in the given namespace (plus shared_namespaces: lib.corpora subscriptions). Always returns
+    {"matches": [...], "namespaces": [...]}: the top_k distinct passages by score as plain dicts
+    {id, score, metadata, namespace} (merge_matches), whether one namespace was queried or several.
+    The institute namespace is queried on the calling thread while the shared ones run on a per-call pool (one
+    thread each), so latency is the slowest single query, not the sum, and concurrent callers never queue behind
+    each other's fan-out.
+    Timed as the "vector_query" stage of the active lib.timing trace, if any.
     """
-    return index.query(
-        vector=vector,
-        namespace=namespace,
-        top_k=top_k,
-        include_metadata=include_metadata,
-    )
+    with trace_stage("vector_query"):
+        shared = [ns for ns in dict.fromkeys(shared_namespaces or ()) if ns != namespace]
+        if not shared:
+            res = index.query(vector=vector, namespace=namespace, top_k=top_k, include_metadata=include_metadata)
+            return {"matches": merge_matches([(namespace, res)], top_k), "namespaces": [namespace]}
+        pool = ThreadPoolExecutor(max_workers=len(shared), thread_name_prefix="pinecone-fanout")
+        try:
+            futures = [
+                (ns, pool.submit(index.query, vector=vector, namespace=ns, top_k=top_k, include_metadata=include_metadata))
+                for ns in shared
+            ]
+            # The institute's own namespace must answer; its errors propagate.
+            results = [(namespace, index.query(vector=vector, namespace=namespace, top_k=top_k, include_metadata=include_metadata))]
+            for ns, fut in futures:
+                try:
+                    results.append((ns, fut.result()))
+                except Exception:
+                    # A failing shared namespace only narrows the context.
+                    logger.exception("Shared namespace query failed: namespace=%s", ns)
+        finally:
+            pool.shutdown(wait=False)
+        return {"matches": merge_matches(results, top_k), "namespaces": [namespace] + shared}
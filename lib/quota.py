@@ -0,0 +1,174 @@
+"""
+Host-local Gemini quota broker: one SQLite-backed token bucket shared by every process on the machine
+(ingest runs, answer workers, audits). Budget = GEMINI_RPM requests/minute; disabled when 0.
+Priorities: "interactive" (student query embeddings) may drain the bucket; "ingest" keeps a reserve
+for interactive traffic and yields while an interactive caller is waiting.
+When Gemini returns a retry delay on 429, block_for() pauses all processes until it has passed;
+the bucket starts refilling (from empty) only when the block ends.
+The n8n answer path calls Gemini directly and never goes through the broker: set GEMINI_RPM below the
+project quota by the rate n8n needs, or its student queries compete with a full-speed ingest for the same quota.
+"""
+import logging
+import os
+import re
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_INGEST = "ingest"
+_PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_INGEST)
+
+# Share of the bucket that ingest traffic may not touch.
+INTERACTIVE_RESERVE_FRACTION = 0.2
+# How long an interactive waiter's "I'm waiting" mark holds ingest back (seconds).
+_INTERACTIVE_WAIT_MARK = 2.0
+# Max sleep per poll while waiting for tokens (seconds).
+_MAX_POLL = 1.0
+
+_RETRY_IN_RE = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY_SECONDS_RE = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+
+
+def default_db_path() -> Path:
+    return Path(tempfile.gettempdir()) / "margai_gemini_quota.sqlite"
+
+
+class QuotaBroker:
+    """Cross-process token bucket. `rpm` refills continuously; `burst` caps stored tokens."""
+
+    def __init__(self, db_path: Path, rpm: int, burst: Optional[int] = None, name: str = "gemini") -> None:
+        if rpm <= 0:
+            raise ValueError("rpm must be > 0")
+        self.db_path = Path(db_path)
+        self.rpm = rpm
+        self.rate = rpm / 60.0
+        self.burst = float(burst or max(1, rpm // 10))
+        self.reserve = self.burst * INTERACTIVE_RESERVE_FRACTION
+        # Tokens ingest needs in the bucket to take one. Capped at burst: with a tiny bucket (GEMINI_RPM < 20,
+        # burst 1) reserve + 1 could never be reached and ingest would wait forever.
+        self.ingest_floor = min(self.burst, self.reserve + 1.0)
+        self.name = name
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,"
+                " blocked_until REAL NOT NULL DEFAULT 0, interactive_waiting_until REAL NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, self.burst, time.time()),
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        import sqlite3
+
+        # isolation_level=None: we issue BEGIN IMMEDIATE ourselves so the read-modify-write is serialised.
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _try_take(self, priority: str) -> float:
+        """Take one token if allowed. Returns 0.0 on success, else seconds to wait before retrying."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, updated, blocked_until, waiting_until = conn.execute(
+                "SELECT tokens, updated, blocked_until, interactive_waiting_until FROM buckets WHERE name = ?",
+                (self.name,),
+            ).fetchone()
+            now = time.time()
+            if now < blocked_until:
+                # Leave tokens/updated alone: polling during a block must not refill the bucket.
+                conn.execute("COMMIT")
+                return blocked_until - now
+            tokens = min(self.burst, tokens + max(0.0, now - max(updated, blocked_until)) * self.rate)
+            wait = 0.0
+            if priority == PRIORITY_INTERACTIVE:
+                if tokens >= 1.0:
+                    tokens -= 1.0
+                else:
+                    wait = (1.0 - tokens) / self.rate
+                    waiting_until = max(waiting_until, now + _INTERACTIVE_WAIT_MARK)
+            else:
+                floor = self.ingest_floor
+                if now < waiting_until:
+                    wait = waiting_until - now
+                elif tokens >= floor:
+                    tokens -= 1.0
+                else:
+                    wait = (floor - tokens) / self.rate
+            conn.execute(
+                "UPDATE buckets SET tokens = ?, updated = ?, interactive_waiting_until = ? WHERE name = ?",
+                (tokens, now, waiting_until, self.name),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def acquire(self, priority: str = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """Block until one request may be sent. Returns seconds waited. Raises TimeoutError after `timeout`."""
+        if priority not in _PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}; expected one of {_PRIORITIES}")
+        start = time.monotonic()
+        while True:
+            wait = self._try_take(priority)
+            if wait <= 0:
+                return time.monotonic() - start
+            if timeout is not None and time.monotonic() - start + wait > timeout:
+                raise TimeoutError(f"Gemini quota not available within {timeout}s (priority={priority})")
+            time.sleep(min(wait, _MAX_POLL))
+
+    def block_for(self, seconds: float) -> None:
+        """Pause all callers for `seconds` (server-provided retry delay) and drain the bucket."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            until = time.time() + seconds
+            conn.execute(
+                "UPDATE buckets SET blocked_until = MAX(blocked_until, ?), tokens = 0, updated = MAX(blocked_until, ?)"
+                " WHERE name = ?",
+                (until, until, self.name),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        logger.warning("Gemini quota: all processes paused for %.1fs (server retry delay)", seconds)
+
+
+def retry_delay_from_error(exc: Exception) -> Optional[float]:
+    """Server-suggested retry delay (seconds) from a Gemini 429, if present."""
+    for detail in getattr(exc, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return float(delay.seconds) + getattr(delay, "nanos", 0) / 1e9
+    msg = str(exc)
+    m = _RETRY_DELAY_SECONDS_RE.search(msg) or _RETRY_IN_RE.search(msg)
+    return float(m.group(1)) if m else None
+
+
+@lru_cache(maxsize=1)
+def get_broker() -> Optional[QuotaBroker]:
+    """Process-wide broker from settings (GEMINI_RPM, GEMINI_QUOTA_DB); None when GEMINI_RPM is 0/unset."""
+    from lib.config import get_settings
+
+    settings = get_settings()
+    if settings.gemini_rpm <= 0:
+        return None
+    db_path = Path(os.path.expanduser(settings.gemini_quota_db)) if settings.gemini_quota_db else default_db_path()
+    return QuotaBroker(db_path, settings.gemini_rpm)
@@ -0,0 +1,13 @@
+"""
+Supabase client for scripts: process-wide cached per (url, key); supabase is imported on first use
+so --help / local-only paths don't pay its import cost.
+"""
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_supabase(url: str, key: str):
+    """Return a cached Supabase client (service_role key for backend scripts)."""
+    from supabase import create_client
+
+    return create_client(url, key)
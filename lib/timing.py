@@ -0,0 +1,127 @@
+"""
+Per-stage latency tracing for the answer path (webhook received → Telegram reply sent).
+Stages: embed, vector_query, llm, db, send. Durations in ms; one row per request in query_timings.
+lib.embedding / lib.pinecone_client record into the active trace (no-op when none is active).
+The n8n workflow writes query_timings too, but its QA chain runs embed, Pinecone and Gemini as sub-nodes that
+cannot be timed apart: n8n rows carry qa_chain_ms only (embed/vector_query/llm NULL). Python rows fill both.
+"""
+import contextvars
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("embed", "vector_query", "llm", "db", "send")
+# Stages inside n8n's Question and Answer Chain; their sum is query_timings.qa_chain_ms.
+QA_CHAIN_STAGES = ("embed", "vector_query", "llm")
+
+# EXPLORATION.md §10: a reply slower than ~5s feels like a bug to students.
+SLOW_REPLY_THRESHOLD_MS = 5000
+
+_current_trace: contextvars.ContextVar[Optional["QueryTrace"]] = contextvars.ContextVar(
+    "margai_query_trace", default=None
+)
+
+
+class QueryTrace:
+    """Accumulates per-stage durations (ms) for one student query."""
+
+    def __init__(self) -> None:
+        self._started = time.perf_counter()
+        self._ended: Optional[float] = None
+        self.stages_ms: dict[str, float] = {}
+        self._open: set[str] = set()
+
+    def add(self, stage: str, elapsed_ms: float) -> None:
+        """Add elapsed_ms to stage (a stage may run more than once per request)."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage!r}; expected one of {STAGES}")
+        self.stages_ms[stage] = self.stages_ms.get(stage, 0.0) + elapsed_ms
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as stage `name`. Nested blocks of the same stage are counted once."""
+        if name in self._open:
+            yield
+            return
+        self._open.add(name)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._open.discard(name)
+            self.add(name, (time.perf_counter() - t0) * 1000.0)
+
+    def finish(self) -> None:
+        """Freeze total_ms at now (the reply was sent). Later calls keep the first end time."""
+        if self._ended is None:
+            self._ended = time.perf_counter()
+
+    def total_ms(self) -> float:
+        """Wall time from start to finish(); to now while the trace is still open."""
+        end = self._ended if self._ended is not None else time.perf_counter()
+        return (end - self._started) * 1000.0
+
+    def to_row(self, institute_id: int, query_log_id: Optional[str] = None) -> dict:
+        """Row for the query_timings table (002 migration)."""
+        row: dict = {
+            "institute_id": institute_id,
+            "query_log_id": query_log_id,
+            "total_ms": round(self.total_ms(), 1),
+        }
+        for s in STAGES:
+            v = self.stages_ms.get(s)
+            row[f"{s}_ms"] = round(v, 1) if v is not None else None
+        chain = [self.stages_ms[s] for s in QA_CHAIN_STAGES if s in self.stages_ms]
+        row["qa_chain_ms"] = round(sum(chain), 1) if chain else None
+        return row
+
+
+@contextmanager
+def start_trace() -> Iterator[QueryTrace]:
+    """Make a new QueryTrace the active trace for the enclosed block; finishes it on exit if not already."""
+    trace = QueryTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_stage(name: str) -> Iterator[None]:
+    """Time the enclosed block into the active trace; no-op when no trace is active."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def record_query_timings(sb, trace: QueryTrace, institute_id: int, query_log_id: Optional[str] = None) -> None:
+    """Insert one query_timings row. Failures are logged, never raised (timing must not break replies)."""
+    row = trace.to_row(institute_id, query_log_id)
+    if row["total_ms"] > SLOW_REPLY_THRESHOLD_MS:
+        logger.warning("Slow reply: total_ms=%s institute_id=%s stages=%s", row["total_ms"], institute_id, trace.stages_ms)
+    try:
+        sb.table("query_timings").insert(row).execute()
+    except Exception:
+        logger.exception("Failed to insert query_timings row")
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile (p in 0–100). None for empty input."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the CLI scripts: runs each one as `python -X importtime <script> --help`
+in a fresh interpreter and reports wall time, total import time and the heaviest top-level imports.
+Local-only scripts have a cold-start target (LOCAL_ONLY_TARGET_MS); --check exits 1 when missed.
+Usage: python scripts/bench_startup.py [--repeat 5] [--ref GIT_REF] [--json PATH] [--compare PATH] [--check]
+  --ref: also benchmark the scripts as of GIT_REF (e.g. the commit before a change) for a before/after table.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+_PILOT = Path(__file__).resolve().parents[1]
+
+SCRIPTS = (
+    "test_ingest_local.py",
+    "ingest_pdf.py",
+    "pinecone_retrieval_audit.py",
+    "weekly_report.py",
+    "cleanup_logs.py",
+)
+# Scripts that never talk to Supabase/Pinecone/Gemini on their --help / local path.
+LOCAL_ONLY_TARGET_MS = {"test_ingest_local.py": 150.0}
+
+
+def _parse_importtime(stderr: str) -> tuple[float, list[tuple[str, float]]]:
+    """(total top-level import ms, [(module, cumulative ms)] for top-level imports)."""
+    top: list[tuple[str, float]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # Nesting is shown by indentation after the "| "; top-level imports have exactly one space.
+        if name.startswith("  "):
+            continue
+        top.append((name.strip(), int(parts[1]) / 1000.0))
+    return sum(ms for _, ms in top), top
+
+
+def bench_script(root: Path, script: str, repeat: int) -> dict:
+    path = root / "scripts" / script
+    walls, imports, heaviest, rc, err = [], [], [], 0, ""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", str(path), "--help"],
+            capture_output=True, text=True, cwd=str(root),
+        )
+        walls.append((time.perf_counter() - t0) * 1000.0)
+        total, top = _parse_importtime(proc.stderr)
+        imports.append(total)
+        heaviest = sorted(top, key=lambda x: x[1], reverse=True)[:5]
+        rc = proc.returncode
+        if rc != 0:
+            err = (proc.stderr.strip().splitlines() or [""])[-1]
+    return {
+        "script": script,
+        "wall_ms": round(statistics.median(walls), 1),
+        "import_ms": round(statistics.median(imports), 1),
+        "heaviest": [[m, round(ms, 1)] for m, ms in heaviest],
+        "returncode": rc,
+        "error": err,
+    }
+
+
+def bench_tree(root: Path, repeat: int) -> dict[str, dict]:
+    return {s: bench_script(root, s, repeat) for s in SCRIPTS if (root / "scripts" / s).exists()}
+
+
+def _export_ref(ref: str, dest: Path) -> Path:
+    """Extract the pilot tree as of `ref` (git archive) into dest."""
+    out = subprocess.run(["git", "archive", ref], cwd=str(_PILOT), capture_output=True, check=True)
+    with tarfile.open(fileobj=BytesIO(out.stdout)) as tar:
+        tar.extractall(dest)
+    return dest
+
+
+def _print_table(after: dict[str, dict], before: dict[str, dict] | None) -> None:
+    for script, r in after.items():
+        line = f"{script:32s} wall={r['wall_ms']:7.1f}ms imports={r['import_ms']:7.1f}ms"
+        b = (before or {}).get(script)
+        if b:
+            line += f"  (before wall={b['wall_ms']:.1f}ms imports={b['import_ms']:.1f}ms, Δwall={r['wall_ms'] - b['wall_ms']:+.1f}ms"
+            line += f", before exit {b['returncode']})" if b["returncode"] != 0 else ")"
+        target = LOCAL_ONLY_TARGET_MS.get(script)
+        if target is not None:
+            line += f"  target<={target:.0f}ms {'OK' if r['wall_ms'] <= target else 'MISSED'}"
+        if r["returncode"] != 0:
+            line += f"  [exit {r['returncode']}: {r['error']}]"
+        print(line)
+        for mod, ms in r["heaviest"]:
+            print(f"    {ms:7.1f}ms  {mod}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold-start / import-time benchmark for scripts/*.py")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per script; median reported (default 5)")
+    parser.add_argument("--ref", type=str, default=None, help="Git ref to benchmark as 'before'")
+    parser.add_argument("--json", type=Path, default=None, help="Write results JSON here")
+    parser.add_argument("--compare", type=Path, default=None, help="Previous --json output to use as 'before'")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a local-only script misses its target")
+    args = parser.parse_args()
+
+    before = None
+    if args.compare:
+        before = json.loads(args.compare.read_text())["after"]
+    elif args.ref:
+        with tempfile.TemporaryDirectory() as tmp:
+            before = bench_tree(_export_ref(args.ref, Path(tmp)), args.repeat)
+    after = bench_tree(_PILOT, args.repeat)
+
+    _print_table(after, before)
+    if args.json:
+        args.json.write_text(json.dumps({"before": before, "after": after}, indent=2) + "\n")
+
+    missed = [s for s, t in LOCAL_ONLY_TARGET_MS.items() if s in after and after[s]["wall_ms"] > t]
+    return 1 if args.check and missed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,8 +10,7 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from supabase import create_client
-from lib.config import get_settings
+from lib.supabase_client import get_supabase
 
 
 def main() -> None:
@@ -19,6 +18,7 @@ def main() -> None:
     parser.add_argument("--dry-run", action="store_true", help="Only print how many rows would be deleted")
     args = parser.parse_args()
 
+    from lib.config import get_settings
     settings = get_settings()
     url = os.environ.get("SUPABASE_URL") or settings.supabase_url
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or settings.supabase_service_role_key
@@ -26,7 +26,7 @@ def main() -> None:
         print("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY", file=sys.stderr)
         sys.exit(1)
 
-    sb = create_client(url, key)
+    sb = get_supabase(url, key)
     cutoff = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
     r = sb.table("query_logs").select("id").lt("timestamp", cutoff).execute()
     count = len(r.data or [])
@@ -2,8 +2,24 @@
 """
 PDF ingestion for MargAI Ghost Tutor: extract (reuse upsc-test-engine), chunk, embed, upsert to Pinecone.
 Usage: python scripts/ingest_pdf.py <path_to.pdf> <institute_slug> [--upload-dir DIR]
+       [--metrics-json PATH] [--prom-textfile PATH] [--profile DIR] [--workers N] [--no-cache] [--no-dedup]
+       [--enqueue | --upload-id UUID] [--shared CORPUS_SLUG] [--dedup-shared]
 - Resolves institute_id from Supabase (by slug); inserts uploads row (processing) then completes/fails.
+- --enqueue: only insert the uploads row as 'queued' for scripts/ingest_worker.py; --upload-id: process an
+  existing (worker-claimed) row instead of inserting one.
 - Namespace = institute_id. Logs extraction outcome (chars, page_count) for observability.
+- --shared CORPUS_SLUG: ingest once into shared namespace 'shared-<slug>' (lib.corpora, 005 migration) that
+  institutes subscribe to; the uploads row stays with the uploading institute. Refused while
+  lib.corpora.SHARED_NAMESPACES_SERVED is False: the n8n answer path never queries shared namespaces.
+- --dedup-shared: also dedup an institute ingest against its subscribed corpora, so a book already in a shared
+  corpus is not embedded again. Off by default: the n8n answer path queries only the institute namespace, so
+  chunks skipped here would never reach students there. Use only when answers go through query_index with
+  shared_namespaces (lib.answer_flow / Python path).
+- --workers N: parallel page-range extraction (lib.extraction; OCR pages first, per-page timing logged).
+- Extraction cache (lib.extraction_cache): unchanged PDF bytes reuse cached text; --no-cache to bypass.
+- Near-duplicate chunks (within the PDF and vs the namespace's chunk_fingerprints) are not embedded (lib.dedup).
+- Per-stage metrics (extract/chunk/embed/upsert wall time, 429 retries + sleeps, bytes upserted, peak RSS)
+  are always logged as JSON; optionally written to a file, a Prometheus textfile, and cProfile dumps per stage.
 """
 import argparse
 import logging
@@ -20,98 +36,72 @@ if UPSC_BACKEND.exists():
 # Project lib
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-from supabase import create_client
-
 from lib.chunking import chunk_with_ids, id_prefix_from_path
+from lib.corpora import (
+    SHARED_NAMESPACES_SERVED,
+    corpus_slug_for_upload,
+    get_or_create_corpus,
+    shared_namespace,
+    subscribed_namespaces,
+)
+from lib.dedup import DedupResult, dedup_chunks, load_namespace_fingerprints, save_fingerprints
 from lib.embedding import get_embeddings_batch
+from lib.extraction_cache import ExtractionCache, extract_cached, get_extraction_cache
+from lib.ingest_metrics import IngestMetrics, activate, incr
 from lib.pinecone_client import get_pinecone_index, upsert_vectors
+from lib.supabase_client import get_supabase
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 
-def extract_text(file_path: Path) -> tuple[str, int, str | None]:
+_SHARED_DISABLED = (
+    "--shared is disabled: the n8n answer path (telegram-webhook.json) queries only the institute namespace, "
+    "so a book in shared-<slug> would reach no student. Ingest it per institute instead."
+)
+
+
+def extract_text(file_path: Path, workers: int = 0, cache: ExtractionCache | None = None) -> tuple[str, int, str | None]:
     """
-    Extract text using upsc-test-engine hybrid extraction when available.
+    Extract text using upsc-test-engine hybrid extraction when available (lib.extraction).
+    workers > 0: shard pages across a process pool instead. cache: reuse text for unchanged PDF bytes.
     Returns (text, page_count, error_message). error_message set on failure.
     """
-    try:
-        from app.services.pdf_extraction_service import extract_hybrid
-    except ImportError:
-        logger.warning("upsc-test-engine not found; using minimal PyMuPDF extraction")
-        try:
-            import pymupdf
-            doc = pymupdf.open(file_path)
-            try:
-                text = "\n\n".join(doc[i].get_text() for i in range(len(doc)))
-                return text.strip(), len(doc), None
-            finally:
-                doc.close()
-        except Exception as e:
-            return "", 0, str(e)
-
-    result = extract_hybrid(file_path)
-    # Observability: log extraction outcome (chars, page count)
-    logger.info(
-        "extraction outcome: total_chars=%s page_count=%s is_valid=%s",
-        len(result.text), result.page_count, result.is_valid,
-    )
-    if not result.is_valid:
-        return result.text or "", result.page_count, result.error_message or "Extraction failed"
-    return result.text, result.page_count, None
+    result = extract_cached(file_path, workers=workers, cache=cache)
+    incr("ocr_pages", result.ocr_pages)
+    return result.text, result.page_count, result.error
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Ingest PDF into Pinecone for an institute")
-    parser.add_argument("pdf_path", type=Path, help="Path to PDF file")
-    parser.add_argument("institute_slug", type=str, help="Institute slug (e.g. fiitjee-kolkata)")
-    parser.add_argument("--upload-dir", type=Path, default=None, help="Optional upload dir for file_path in DB")
-    parser.add_argument("--supabase-url", type=str, default=None, help="Supabase URL (or env SUPABASE_URL)")
-    parser.add_argument("--supabase-key", type=str, default=None, help="Supabase service_role key (or env)")
-    args = parser.parse_args()
+def _dedup_existing(
+    sb, namespace: str, institute_id: int, corpus_slug: str | None, source_file: str, include_shared: bool = False,
+) -> list:
+    """Fingerprints to dedup against: the target namespace, plus (include_shared) the institute's subscribed corpora."""
+    existing = load_namespace_fingerprints(sb, namespace, exclude_source=source_file)
+    if include_shared and corpus_slug is None:
+        try:
+            shared = subscribed_namespaces(sb, institute_id)
+        except Exception as e:
+            logger.warning("Corpus subscriptions unavailable (run 005 migration?): %s", e)
+            shared = []
+        for ns in shared:
+            existing.extend(load_namespace_fingerprints(sb, ns))
+    return existing
 
-    pdf_path = args.pdf_path.resolve()
-    if not pdf_path.exists():
-        logger.error("PDF not found: %s", pdf_path)
-        sys.exit(1)
 
+def _ingest(
+    args, pdf_path: Path, sb, settings, institute_id: int, upload_id, metrics: IngestMetrics,
+    corpus_slug: str | None = None,
+) -> None:
+    """Extract → chunk → dedup → embed → upsert for one uploads row; marks it completed/failed. Exits on failure."""
     import os
-    from lib.config import get_settings
-    settings = get_settings()
-    supabase_url = args.supabase_url or settings.supabase_url or os.environ.get("SUPABASE_URL")
-    supabase_key = args.supabase_key or settings.supabase_service_role_key or os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-    if not supabase_url or not supabase_key:
-        logger.error("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (or .env)")
-        sys.exit(1)
-
-    sb = create_client(supabase_url, supabase_key)
-
-    # Resolve institute_id by slug (create if missing for pilot)
-    r = sb.table("institutes").select("id").eq("slug", args.institute_slug).execute()
-    if r.data and len(r.data) > 0:
-        institute_id = int(r.data[0]["id"])
-    else:
-        ins = sb.table("institutes").insert({"slug": args.institute_slug}).execute()
-        if not ins.data or len(ins.data) == 0:
-            logger.error("Failed to create institute for slug %s", args.institute_slug)
-            sys.exit(1)
-        institute_id = int(ins.data[0]["id"])
-    logger.info("Using institute_id=%s for slug=%s", institute_id, args.institute_slug)
-
-    file_path_stored = str(args.upload_dir / pdf_path.name) if args.upload_dir else str(pdf_path)
-    upload_row = sb.table("uploads").insert({
-        "institute_id": institute_id,
-        "file_path": file_path_stored,
-        "filename": pdf_path.name,
-        "status": "processing",
-    }).execute()
-    if not upload_row.data or len(upload_row.data) == 0:
-        logger.error("Failed to insert uploads row")
-        sys.exit(1)
-    upload_id = upload_row.data[0]["id"]
-
+    namespace = shared_namespace(corpus_slug) if corpus_slug else str(institute_id)
+    owner_slug = corpus_slug or args.institute_slug
     try:
-        text, page_count, err = extract_text(pdf_path)
+        with metrics.stage("extract"):
+            cache = None if args.no_cache else get_extraction_cache()
+            text, page_count, err = extract_text(pdf_path, workers=args.workers, cache=cache)
+        metrics.incr("pages", page_count)
+        metrics.incr("chars", len(text or ""))
         if err:
             sb.table("uploads").update({
                 "status": "failed",
@@ -128,12 +118,28 @@ def main() -> None:
             logger.error("Extracted text too short (chars=%s)", len(text.strip()))
             sys.exit(1)
 
-        prefix = id_prefix_from_path(pdf_path, args.institute_slug)
-        chunks_with_ids = chunk_with_ids(text, prefix)
+        with metrics.stage("chunk"):
+            prefix = id_prefix_from_path(pdf_path, owner_slug)
+            chunks_with_ids = chunk_with_ids(text, prefix)
+        metrics.incr("chunks", len(chunks_with_ids))
         if not chunks_with_ids:
             sb.table("uploads").update({"status": "failed", "error_message": "No chunks produced"}).eq("id", upload_id).execute()
             sys.exit(1)
 
+        dedup: DedupResult | None = None
+        if not args.no_dedup:
+            with metrics.stage("dedup"):
+                try:
+                    existing = _dedup_existing(
+                        sb, namespace, institute_id, corpus_slug, pdf_path.name, include_shared=args.dedup_shared
+                    )
+                except Exception as e:
+                    logger.warning("chunk_fingerprints unavailable (run 003 migration?); deduping within PDF only: %s", e)
+                    existing = []
+                dedup = dedup_chunks(chunks_with_ids, existing)
+            metrics.incr("chunks_deduped", dedup.saved)
+            chunks_with_ids = dedup.kept
+
         api_key = settings.gemini_api_key or os.environ.get("GEMINI_API_KEY")
         if not api_key:
             logger.error("Set GEMINI_API_KEY")
@@ -141,7 +147,8 @@ def main() -> None:
             sys.exit(1)
 
         try:
-            embeddings = get_embeddings_batch([t for _, t in chunks_with_ids], api_key)
+            with metrics.stage("embed"):
+                embeddings = get_embeddings_batch([t for _, t in chunks_with_ids], api_key)
         except RuntimeError as e:
             if "API key" in str(e) or "API_KEY" in str(e):
                 logger.error("Gemini API key rejected. Set a valid GEMINI_API_KEY in margai-ghost-tutor-pilot/.env (get one at https://aistudio.google.com/app/apikey).")
@@ -153,7 +160,7 @@ def main() -> None:
                 {
                     "text": t,
                     "source_file": pdf_path.name,
-                    "source_slug": args.institute_slug,
+                    "source_slug": owner_slug,
                     "chunk_id": cid,
                 },
             )
@@ -166,14 +173,23 @@ def main() -> None:
             sb.table("uploads").update({"status": "failed", "error_message": "PINECONE_API_KEY not set"}).eq("id", upload_id).execute()
             sys.exit(1)
 
-        index = get_pinecone_index(pc_key, settings.pinecone_index_name or os.environ.get("PINECONE_INDEX_NAME", "margai-ghost-tutor-v2"))
-        upsert_vectors(index, vectors, namespace=str(institute_id))
+        with metrics.stage("upsert"):
+            index = get_pinecone_index(pc_key, settings.pinecone_index_name or os.environ.get("PINECONE_INDEX_NAME", "margai-ghost-tutor-v2"))
+            upsert_vectors(index, vectors, namespace=namespace)
+        if dedup is not None:
+            try:
+                save_fingerprints(sb, namespace, pdf_path.name, dedup)
+            except Exception as e:
+                logger.warning("Failed to save chunk fingerprints: %s", e)
 
         sb.table("uploads").update({
             "status": "completed",
             "completed_at": datetime.now(timezone.utc).isoformat(),
         }).eq("id", upload_id).execute()
-        logger.info("Ingestion complete: upload_id=%s namespace=%s chunks=%s", upload_id, institute_id, len(vectors))
+        logger.info(
+            "Ingestion complete: upload_id=%s namespace=%s chunks=%s embeddings_saved=%s",
+            upload_id, namespace, len(vectors), dedup.saved if dedup else 0,
+        )
     except Exception as e:
         logger.exception("Ingestion failed: %s", e)
         sb.table("uploads").update({
@@ -183,5 +199,109 @@ def main() -> None:
         sys.exit(1)
 
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest PDF into Pinecone for an institute")
+    parser.add_argument("pdf_path", type=Path, help="Path to PDF file")
+    parser.add_argument("institute_slug", type=str, help="Institute slug (e.g. fiitjee-kolkata)")
+    parser.add_argument("--upload-dir", type=Path, default=None, help="Optional upload dir for file_path in DB")
+    parser.add_argument("--supabase-url", type=str, default=None, help="Supabase URL (or env SUPABASE_URL)")
+    parser.add_argument("--supabase-key", type=str, default=None, help="Supabase service_role key (or env)")
+    parser.add_argument("--metrics-json", type=Path, default=None, help="Write ingest metrics JSON summary here")
+    parser.add_argument("--prom-textfile", type=Path, default=None, help="Write Prometheus textfile (e.g. node_exporter textfile dir/*.prom)")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel page extraction with N processes (0 = serial hybrid extraction)")
+    parser.add_argument("--enqueue", action="store_true", help="Insert a 'queued' uploads row for ingest_worker.py and exit")
+    parser.add_argument("--upload-id", type=str, default=None, help="Process this existing uploads row (used by ingest_worker.py)")
+    parser.add_argument("--shared", type=str, default=None, metavar="CORPUS_SLUG", help="Ingest into shared corpus namespace shared-<slug> (disabled: n8n does not query it yet)")
+    parser.add_argument(
+        "--dedup-shared",
+        action="store_true",
+        help="Also skip chunks already in subscribed shared corpora (only if answers query shared namespaces; n8n does not)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the extraction cache (always re-extract)")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed every chunk (skip near-duplicate elimination)")
+    parser.add_argument("--profile", type=Path, default=None, metavar="DIR", help="Write a cProfile dump per stage to DIR/<stage>.prof")
+    args = parser.parse_args()
+    if args.shared:
+        if not SHARED_NAMESPACES_SERVED:
+            parser.error(_SHARED_DISABLED)
+        try:
+            shared_namespace(args.shared)
+        except ValueError as e:
+            parser.error(str(e))
+
+    pdf_path = args.pdf_path.resolve()
+    if not pdf_path.exists():
+        logger.error("PDF not found: %s", pdf_path)
+        sys.exit(1)
+
+    import os
+    from lib.config import get_settings
+    settings = get_settings()
+    supabase_url = args.supabase_url or settings.supabase_url or os.environ.get("SUPABASE_URL")
+    supabase_key = args.supabase_key or settings.supabase_service_role_key or os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not supabase_url or not supabase_key:
+        logger.error("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (or .env)")
+        sys.exit(1)
+
+    sb = get_supabase(supabase_url, supabase_key)
+
+    # Resolve institute_id by slug (create if missing for pilot)
+    r = sb.table("institutes").select("id").eq("slug", args.institute_slug).execute()
+    if r.data and len(r.data) > 0:
+        institute_id = int(r.data[0]["id"])
+    else:
+        ins = sb.table("institutes").insert({"slug": args.institute_slug}).execute()
+        if not ins.data or len(ins.data) == 0:
+            logger.error("Failed to create institute for slug %s", args.institute_slug)
+            sys.exit(1)
+        institute_id = int(ins.data[0]["id"])
+    logger.info("Using institute_id=%s for slug=%s", institute_id, args.institute_slug)
+
+    corpus_slug = args.shared
+    corpus_id = get_or_create_corpus(sb, corpus_slug) if corpus_slug else None
+    if args.upload_id:
+        upload_id = args.upload_id
+        if corpus_slug is None:
+            # Rows queued with --shared carry corpus_id; the worker only passes --upload-id.
+            try:
+                corpus_slug = corpus_slug_for_upload(sb, upload_id)
+            except Exception as e:
+                logger.warning("Could not read uploads.corpus_id (run 005 migration?): %s", e)
+            if corpus_slug is not None and not SHARED_NAMESPACES_SERVED:
+                sb.table("uploads").update({"status": "failed", "error_message": _SHARED_DISABLED}).eq("id", upload_id).execute()
+                logger.error(_SHARED_DISABLED)
+                sys.exit(1)
+    else:
+        file_path_stored = str(args.upload_dir / pdf_path.name) if args.upload_dir else str(pdf_path)
+        upload_row = sb.table("uploads").insert({
+            "institute_id": institute_id,
+            "file_path": file_path_stored,
+            "filename": pdf_path.name,
+            "status": "queued" if args.enqueue else "processing",
+            **({"corpus_id": corpus_id} if corpus_id is not None else {}),
+        }).execute()
+        if not upload_row.data or len(upload_row.data) == 0:
+            logger.error("Failed to insert uploads row")
+            sys.exit(1)
+        upload_id = upload_row.data[0]["id"]
+        if args.enqueue:
+            logger.info("Queued upload_id=%s for institute_id=%s (run scripts/ingest_worker.py)", upload_id, institute_id)
+            return
+
+    labels = {"institute_slug": args.institute_slug, "source_file": pdf_path.name}
+    if corpus_slug:
+        labels["corpus"] = corpus_slug
+    metrics = IngestMetrics(labels=labels, profile_dir=args.profile)
+    try:
+        with activate(metrics):
+            _ingest(args, pdf_path, sb, settings, institute_id, upload_id, metrics, corpus_slug=corpus_slug)
+        metrics.status = "completed"
+    except BaseException:
+        metrics.status = "failed"
+        raise
+    finally:
+        metrics.write(json_path=args.metrics_json, prom_path=args.prom_textfile)
+
+
 if __name__ == "__main__":
     main()
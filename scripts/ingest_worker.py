@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Ingest worker daemon: claims queued uploads (status 'queued', 004 migration) and runs
+`ingest_pdf.py --upload-id` for each, several institutes concurrently within configurable limits.
+- Claim is atomic (FOR UPDATE SKIP LOCKED in claim_upload); at most --per-institute jobs per institute.
+- Heartbeats running jobs; rows whose worker died are re-queued by the next claim (--stale-after).
+  A job this worker no longer owns (re-queued while heartbeats failed) is terminated so it never runs twice;
+  if heartbeats keep failing for --stale-after, running jobs are terminated before another worker can re-claim them.
+- Queue (Supabase/Postgres) errors are logged and retried with backoff; they never stop the daemon.
+- Queue depth and job latency logged each --stats-interval and optionally written as a Prometheus textfile.
+Usage: python scripts/ingest_worker.py [--concurrency 2] [--per-institute 1] [--once] [--dsn postgresql://...]
+  --dsn: use a direct Postgres connection for the queue (local testing); default is Supabase from .env.
+  SIGTERM/SIGINT: stop claiming and wait for running jobs; a second signal terminates them.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from lib.ingest_metrics import write_atomic
+from lib.ingest_queue import UploadJob, UploadQueue
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("ingest_worker")
+
+INGEST_SCRIPT = Path(__file__).resolve().parent / "ingest_pdf.py"
+# Backoff after queue errors: poll_interval doubled per consecutive error, capped here (seconds).
+MAX_ERROR_BACKOFF_S = 60.0
+
+
+class _Running:
+    def __init__(self, job: UploadJob, proc: subprocess.Popen) -> None:
+        self.job = job
+        self.proc = proc
+        self.started = time.monotonic()
+        self.lost = False  # terminated because the row is no longer ours
+
+
+class Worker:
+    def __init__(self, queue: UploadQueue, args) -> None:
+        self.queue = queue
+        self.args = args
+        self.running: dict[str, _Running] = {}
+        self.jobs_total = {"completed": 0, "failed": 0}
+        self.last_run_s = 0.0
+        self.stopping = False
+        self.last_beat_ok = time.monotonic()
+
+    def _spawn(self, job: UploadJob) -> None:
+        cmd = [sys.executable, str(self.args.ingest_script), job.file_path, job.institute_slug, "--upload-id", job.id]
+        if self.args.metrics_dir:
+            cmd += ["--metrics-json", str(self.args.metrics_dir / f"{job.id}.json")]
+        cmd += self.args.ingest_args
+        logger.info(
+            "Claimed upload_id=%s institute=%s file=%s attempt=%s",
+            job.id, job.institute_slug, job.filename, job.attempts,
+        )
+        # New session: a terminal Ctrl-C reaches the worker only, which drains instead of killing jobs.
+        self.running[job.id] = _Running(job, subprocess.Popen(cmd, start_new_session=True))
+
+    def _reap(self) -> None:
+        for upload_id, r in list(self.running.items()):
+            rc = r.proc.poll()
+            if rc is None:
+                continue
+            elapsed = time.monotonic() - r.started
+            del self.running[upload_id]
+            self.last_run_s = elapsed
+            if rc == 0:
+                self.jobs_total["completed"] += 1
+                logger.info("Finished upload_id=%s in %.1fs", upload_id, elapsed)
+                continue
+            self.jobs_total["failed"] += 1
+            if r.lost:
+                logger.error("upload_id=%s stopped after %.1fs (ownership lost)", upload_id, elapsed)
+                continue
+            # ingest_pdf.py records its own failures; this only catches crashes / early exits.
+            try:
+                marked = self.queue.fail_if_processing(upload_id, f"ingest_pdf.py exited with code {rc}")
+            except Exception as e:
+                # The row keeps its last heartbeat and is re-queued / failed once it goes stale.
+                logger.error("upload_id=%s exited with code %s; could not mark failed: %s", upload_id, rc, e)
+                continue
+            if marked:
+                logger.error("upload_id=%s exited with code %s; marked failed", upload_id, rc)
+            else:
+                logger.error("upload_id=%s exited with code %s after %.1fs", upload_id, rc, elapsed)
+
+    def _stop(self, r: _Running, reason: str) -> None:
+        if r.lost or r.proc.poll() is not None:
+            return
+        logger.error("Terminating upload_id=%s: %s", r.job.id, reason)
+        r.lost = True
+        r.proc.terminate()
+
+    def _heartbeat(self) -> None:
+        """Refresh heartbeats; stop jobs that are no longer ours. Raises on queue errors."""
+        lost = set(self.queue.heartbeat(list(self.running)))
+        self.last_beat_ok = time.monotonic()
+        for upload_id in lost:
+            r = self.running.get(upload_id)
+            if r is not None:
+                self._stop(r, "row no longer claimed by this worker (re-queued after a stale heartbeat?)")
+
+    def _fill(self) -> bool:
+        """Claim jobs up to --concurrency. Returns True if anything was claimed."""
+        claimed = False
+        while not self.stopping and len(self.running) < self.args.concurrency:
+            job = self.queue.claim(
+                max_per_institute=self.args.per_institute,
+                stale_after_s=self.args.stale_after,
+                max_attempts=self.args.max_attempts,
+            )
+            if job is None:
+                break
+            self._spawn(job)
+            claimed = True
+        return claimed
+
+    def _report(self) -> None:
+        try:
+            stats = self.queue.stats()
+        except Exception as e:
+            logger.warning("ingest_queue_stats unavailable: %s", e)
+            stats = []
+        depth = sum(int(s.get("queued") or 0) for s in stats)
+        logger.info(
+            "queue: depth=%s running=%s completed=%s failed=%s",
+            depth, len(self.running), self.jobs_total["completed"], self.jobs_total["failed"],
+        )
+        if self.args.prom_textfile:
+            write_atomic(self.args.prom_textfile, _to_prometheus(self.queue.worker_id, stats, self))
+
+    def handle_signal(self, signum, frame) -> None:
+        if self.stopping:
+            logger.warning("Second signal: terminating %s running job(s)", len(self.running))
+            for r in self.running.values():
+                r.proc.terminate()
+            return
+        logger.info("Signal %s: draining %s running job(s); send again to terminate", signum, len(self.running))
+        self.stopping = True
+
+    def _step(self, name: str, fn) -> bool:
+        """Run one queue step; log and swallow its errors (retried next poll). Returns True on success."""
+        try:
+            fn()
+            return True
+        except Exception as e:
+            logger.error("Queue error during %s: %s", name, e)
+            return False
+
+    def run(self) -> None:
+        last_beat = last_stats = 0.0
+        errors = 0
+        try:
+            while True:
+                claimed = []
+                ok = self._step("reap", self._reap)
+                now = time.monotonic()
+                if not self.running:
+                    self.last_beat_ok = now
+                elif now - last_beat >= self.args.heartbeat_interval:
+                    if self._step("heartbeat", self._heartbeat):
+                        last_beat = now
+                    else:
+                        ok = False
+                        # Our rows go stale without heartbeats and get re-claimed: stop the jobs before that happens.
+                        silent = now - self.last_beat_ok
+                        if silent >= self.args.stale_after - self.args.heartbeat_interval:
+                            for r in self.running.values():
+                                self._stop(r, f"no successful heartbeat for {silent:.0f}s")
+                ok = self._step("claim", lambda: claimed.append(self._fill())) and ok
+                errors = 0 if ok else errors + 1
+                if now - last_stats >= self.args.stats_interval:
+                    self._step("report", self._report)
+                    last_stats = now
+                if not self.running and (self.stopping or (self.args.once and ok and not any(claimed))):
+                    break
+                delay = self.args.poll_interval
+                if errors:
+                    delay = min(MAX_ERROR_BACKOFF_S, max(delay, 1.0) * 2 ** (errors - 1))
+                    logger.warning("Retrying queue in %.0fs (%s failed poll(s) in a row)", delay, errors)
+                time.sleep(delay)
+        except BaseException:
+            # Jobs run in their own session and would outlive the daemon without heartbeats.
+            for r in self.running.values():
+                self._stop(r, "worker exiting")
+            raise
+        self._step("report", self._report)
+
+
+def _to_prometheus(worker_id: str, stats: list[dict], worker: Worker) -> str:
+    lines = [
+        "# HELP margai_ingest_queue_depth Queued uploads per institute.",
+        "# TYPE margai_ingest_queue_depth gauge",
+    ]
+    for s in stats:
+        lines.append(f'margai_ingest_queue_depth{{institute_id="{s["institute_id"]}"}} {int(s.get("queued") or 0)}')
+    lines.extend(["# HELP margai_ingest_queue_oldest_seconds Age of the oldest queued upload per institute.",
+                  "# TYPE margai_ingest_queue_oldest_seconds gauge"])
+    for s in stats:
+        lines.append(f'margai_ingest_queue_oldest_seconds{{institute_id="{s["institute_id"]}"}} {float(s.get("oldest_queued_s") or 0)}')
+    lines.extend(["# HELP margai_ingest_job_wait_seconds_avg_24h Mean queued→started latency (24h).",
+                  "# TYPE margai_ingest_job_wait_seconds_avg_24h gauge"])
+    for s in stats:
+        if s.get("avg_wait_s_24h") is not None:
+            lines.append(f'margai_ingest_job_wait_seconds_avg_24h{{institute_id="{s["institute_id"]}"}} {float(s["avg_wait_s_24h"])}')
+    lines.extend(["# HELP margai_ingest_job_run_seconds_avg_24h Mean started→completed time (24h).",
+                  "# TYPE margai_ingest_job_run_seconds_avg_24h gauge"])
+    for s in stats:
+        if s.get("avg_run_s_24h") is not None:
+            lines.append(f'margai_ingest_job_run_seconds_avg_24h{{institute_id="{s["institute_id"]}"}} {float(s["avg_run_s_24h"])}')
+    w = f'worker="{worker_id}"'
+    lines.extend([
+        "# TYPE margai_ingest_worker_running gauge",
+        f"margai_ingest_worker_running{{{w}}} {len(worker.running)}",
+        "# TYPE margai_ingest_worker_jobs_total counter",
+        f'margai_ingest_worker_jobs_total{{{w},result="completed"}} {worker.jobs_total["completed"]}',
+        f'margai_ingest_worker_jobs_total{{{w},result="failed"}} {worker.jobs_total["failed"]}',
+        "# TYPE margai_ingest_worker_last_run_seconds gauge",
+        f"margai_ingest_worker_last_run_seconds{{{w}}} {worker.last_run_s:.3f}",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run queued PDF ingests (uploads.status='queued')")
+    parser.add_argument("--concurrency", type=int, default=2, help="Max ingests running at once (default 2)")
+    parser.add_argument("--per-institute", type=int, default=1, help="Max running ingests per institute (default 1)")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between queue polls (default 5)")
+    parser.add_argument("--heartbeat-interval", type=float, default=30.0, help="Seconds between heartbeats (default 30)")
+    parser.add_argument("--stale-after", type=int, default=600, help="Re-queue jobs whose heartbeat is older than this (s, default 600)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Fail a job after this many lost-heartbeat attempts (default 3)")
+    parser.add_argument("--stats-interval", type=float, default=60.0, help="Seconds between queue stats reports (default 60)")
+    parser.add_argument("--prom-textfile", type=Path, default=None, help="Write queue/worker gauges here (Prometheus textfile)")
+    parser.add_argument("--metrics-dir", type=Path, default=None, help="Pass --metrics-json <dir>/<upload_id>.json to each ingest")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty and all jobs have finished")
+    parser.add_argument("--dsn", type=str, default=None, help="Postgres DSN for the queue (local testing; needs psycopg)")
+    parser.add_argument("--ingest-script", type=Path, default=INGEST_SCRIPT, help="Job script (default ingest_pdf.py; a stub for local tests)")
+    parser.add_argument("--worker-id", type=str, default=None, help="Default: <hostname>-<pid>-<random>")
+    parser.add_argument("ingest_args", nargs=argparse.REMAINDER, help="Extra args for ingest_pdf.py after `--` (e.g. -- --workers 4)")
+    args = parser.parse_args()
+    if args.ingest_args and args.ingest_args[0] == "--":
+        args.ingest_args = args.ingest_args[1:]
+
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    if args.dsn:
+        from lib.ingest_queue import PostgresQueue
+        queue: UploadQueue = PostgresQueue(args.dsn, worker_id)
+    else:
+        from lib.config import get_settings
+        from lib.ingest_queue import SupabaseQueue
+        from lib.supabase_client import get_supabase
+        settings = get_settings()
+        url = os.environ.get("SUPABASE_URL") or settings.supabase_url
+        key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or settings.supabase_service_role_key
+        if not url or not key:
+            logger.error("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (or pass --dsn)")
+            return 1
+        queue = SupabaseQueue(get_supabase(url, key), worker_id)
+
+    worker = Worker(queue, args)
+    signal.signal(signal.SIGTERM, worker.handle_signal)
+    signal.signal(signal.SIGINT, worker.handle_signal)
+    logger.info(
+        "ingest worker %s: concurrency=%s per_institute=%s stale_after=%ss",
+        worker_id, args.concurrency, args.per_institute, args.stale_after,
+    )
+    worker.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the Telegram answer path (lib.answer_flow, the Python reference of telegram-webhook.json).
+Replays synthetic or recorded webhook payloads at --rate with up to --concurrency in flight, against local
+stand-ins for Gemini embed/chat, Pinecone, Supabase and the Telegram API. No network, no API keys.
+- Embeddings go through the real lib.embedding retry path (and quota broker with --gemini-rpm);
+  Pinecone goes through the real lib.pinecone_client.query_index with a stand-in index.
+- Each stand-in has a median latency (lognormal), an optional capacity (max concurrent calls; excess calls queue)
+  and a 429 rate.
+- Reports throughput, end-to-end p50/p95/p99 (arrival → reply sent), error rates, and where time goes:
+  waiting for a worker slot, queued at a stand-in's capacity, or in service (embed service includes 429 backoff
+  and quota broker waits).
+Usage: python scripts/loadtest_answer_path.py [--requests 500] [--rate 0] [--concurrency 50]
+         [--llm-ms 2500 --llm-capacity 20 --llm-429 0.02] [--payloads updates.jsonl] [--json PATH]
+  --rate 0 sends every request at once ("500 students before an exam").
+  --payloads: JSONL (or JSON array) of Telegram updates, or n8n webhook items with the update under "body".
+  --cache: in-memory semantic answer cache (lib.answer_cache, needs numpy). The embed stand-in maps paraphrases
+  (a known prefix + question) close to the question's vector, so --paraphrase-rate drives the hit rate.
+"""
+import argparse
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from lib.timing import SLOW_REPLY_THRESHOLD_MS, STAGES, percentile
+
+# (median ms, capacity) per stand-in; capacity 0 = unlimited concurrent calls.
+DEFAULT_SERVICES = {
+    "embed": (150.0, 0),
+    "vector_query": (80.0, 0),
+    "llm": (2500.0, 0),
+    "db": (60.0, 0),
+    "send": (200.0, 0),
+}
+_QUESTIONS = (
+    "what caused distress among cotton farmers?",
+    "explain the difference between weather and climate",
+    "why did the non-cooperation movement end?",
+    "what is the function of the nephron?",
+    "state Ohm's law with an example",
+    "how is the rate of a reaction affected by temperature?",
+    "what were the main features of the Green Revolution?",
+    "define opportunity cost",
+)
+# Synthetic paraphrases = prefix + question; the embed stand-in embeds them near the bare question.
+_PARAPHRASE_PREFIXES = ("sir please explain ", "can you tell me ", "doubt: ", "quick question - ")
+# Noise amplitude for paraphrases: cosine to the bare question ≈ 1 / sqrt(1 + a²) ≈ 0.97.
+_PARAPHRASE_NOISE = 0.25
+
+# Per-request capacity wait (ms) by stand-in name; set by the worker thread running the request.
+_queue_ms: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("loadtest_queue_ms", default=None)
+
+
+class RateLimited(Exception):
+    pass
+
+
+class StandIn:
+    """One external service: lognormal latency around median_ms, at most `capacity` calls in flight, random 429s."""
+
+    def __init__(self, name: str, median_ms: float, capacity: int, rate_429: float, sigma: float, seed: int) -> None:
+        self.name = name
+        self.median_ms = median_ms
+        self.rate_429 = rate_429
+        self.sigma = sigma
+        self._sem = threading.BoundedSemaphore(capacity) if capacity > 0 else None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rate_limited = 0
+
+    def _draw(self) -> tuple[float, bool]:
+        with self._lock:
+            self.calls += 1
+            latency = self.median_ms * math.exp(self._rng.gauss(0.0, self.sigma)) if self.median_ms > 0 else 0.0
+            limited = self._rng.random() < self.rate_429
+            if limited:
+                self.rate_limited += 1
+        return latency, limited
+
+    def call(self) -> None:
+        t0 = time.perf_counter()
+        if self._sem is not None:
+            self._sem.acquire()
+        waits = _queue_ms.get()
+        if waits is not None:
+            waits[self.name] = waits.get(self.name, 0.0) + (time.perf_counter() - t0) * 1000.0
+        try:
+            latency, limited = self._draw()
+            # 429s answer fast, like the real APIs.
+            time.sleep((latency / 10.0 if limited else latency) / 1000.0)
+            if limited:
+                raise RateLimited(f"429 {self.name}: Resource has been exhausted (e.g. check quota).")
+        finally:
+            if self._sem is not None:
+                self._sem.release()
+
+
+class _StandInGenAI:
+    """Replaces google.generativeai inside lib.embedding so its retry/broker code runs unchanged."""
+
+    def __init__(self, service: StandIn, dimension: int) -> None:
+        self.service = service
+        self.dimension = dimension
+
+    def configure(self, api_key: str) -> None:
+        pass
+
+    def _random_vector(self, text: str, scale: float) -> list[float]:
+        rng = random.Random(hashlib.sha1(text.encode()).digest())
+        return [scale * (2.0 * rng.random() - 1.0) for _ in range(self.dimension)]
+
+    def embed_content(self, model: str, content: str, output_dimensionality: int) -> dict:
+        self.service.call()
+        text = content.strip().lower()
+        base = text
+        for prefix in _PARAPHRASE_PREFIXES:
+            if base.startswith(prefix):
+                base = base[len(prefix):]
+                break
+        vector = self._random_vector(base, 1.0)
+        if base != text:
+            vector = [a + b for a, b in zip(vector, self._random_vector(text, _PARAPHRASE_NOISE))]
+        return {"embedding": vector}
+
+
+class _StandInIndex:
+    """Pinecone Index stand-in for query_index."""
+
+    def __init__(self, service: StandIn) -> None:
+        self.service = service
+
+    def query(self, vector, namespace: str, top_k: int, include_metadata: bool = True) -> dict:
+        self.service.call()
+        return {"matches": [
+            {"id": f"stub.pdf_{i}", "score": 0.8 - i * 0.01, "metadata": {"text": f"Context passage {i} ({namespace})."}}
+            for i in range(top_k)
+        ]}
+
+
+def _build_deps(services: dict[str, StandIn], escalate_rate: float, seed: int, shared_namespaces: list[str], cache=None):
+    from lib import embedding
+    from lib.answer_flow import AnswerDeps
+    from lib.pinecone_client import query_index
+    from lib.quota import get_broker
+
+    get_broker()  # load settings / open the broker now, not inside the first timed embeds
+    embedding._genai = _StandInGenAI(services["embed"], embedding.EMBEDDING_DIMENSION)
+    embedding._configured_key = "loadtest"
+    index = _StandInIndex(services["vector_query"])
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def chat(question: str, contexts: list[str]) -> str:
+        services["llm"].call()
+        with rng_lock:
+            escalate = rng.random() < escalate_rate
+        return "ESCALATE" if escalate else f"Answer to: {question}"
+
+    def log_query(row: dict) -> str:
+        services["db"].call()
+        return "00000000-0000-0000-0000-000000000000"
+
+    return AnswerDeps(
+        embed=lambda text: embedding.get_embedding(text, api_key="loadtest"),
+        query=lambda vector, namespace, top_k: query_index(
+            index, vector, namespace, top_k, shared_namespaces=shared_namespaces
+        )["matches"],
+        chat=chat,
+        log_query=log_query,
+        mark_clarification=lambda query_log_id: services["db"].call(),
+        send=lambda chat_id, text: services["send"].call(),
+        get_file=lambda file_id: services["send"].call(),
+        record_timings=lambda trace, institute_id, query_log_id: services["db"].call(),
+        cache=cache,
+    )
+
+
+def synthetic_updates(
+    n: int, students: int, photo_rate: float, empty_rate: float, seed: int, paraphrase_rate: float = 0.0,
+) -> list[dict]:
+    rng = random.Random(seed)
+
+    def question() -> str:
+        q = rng.choice(_QUESTIONS)
+        return rng.choice(_PARAPHRASE_PREFIXES) + q if rng.random() < paraphrase_rate else q
+
+    updates = []
+    for i in range(n):
+        student = 100000 + rng.randrange(students)
+        message: dict = {
+            "message_id": i + 1,
+            "from": {"id": student, "first_name": f"Student{student}"},
+            "chat": {"id": student, "type": "private"},
+            "date": int(time.time()),
+        }
+        r = rng.random()
+        if r < empty_rate:
+            message["sticker"] = {"file_id": "sticker"}
+        elif r < empty_rate + photo_rate:
+            message["photo"] = [{"file_id": f"photo{i}_s"}, {"file_id": f"photo{i}"}]
+            message["caption"] = question()
+        else:
+            message["text"] = question()
+        updates.append({"update_id": 500000 + i, "message": message})
+    return updates
+
+
+def load_payloads(path: Path) -> list[dict]:
+    raw = path.read_text(encoding="utf-8").strip()
+    items = json.loads(raw) if raw.startswith("[") else [json.loads(line) for line in raw.splitlines() if line.strip()]
+    return [item["body"] if isinstance(item.get("body"), dict) else item for item in items]
+
+
+@dataclass
+class Sample:
+    status: str
+    cached: bool
+    error_stage: Optional[str]
+    rate_limited: bool
+    e2e_ms: float
+    pool_wait_ms: float
+    stages_ms: dict[str, float]
+    queue_ms: dict[str, float] = field(default_factory=dict)
+
+
+def run_load(updates: list[dict], deps, rate: float, concurrency: int, institute_id: int) -> tuple[list[Sample], float]:
+    """Open-loop replay: request i arrives at i / rate seconds whether or not earlier ones finished."""
+    from lib.answer_flow import handle_update
+
+    def one(update: dict, arrival: float) -> Sample:
+        start = time.perf_counter()
+        waits: dict[str, float] = {}
+        _queue_ms.set(waits)
+        result = handle_update(update, deps, institute_id=institute_id)
+        end = time.perf_counter()
+        return Sample(
+            status=result.status,
+            cached=result.cached,
+            error_stage=result.error_stage,
+            rate_limited="429" in (result.error or ""),
+            e2e_ms=(end - arrival) * 1000.0,
+            pool_wait_ms=(start - arrival) * 1000.0,
+            stages_ms=dict(result.trace.stages_ms),
+            queue_ms=waits,
+        )
+
+    t0 = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, update in enumerate(updates):
+            if rate > 0:
+                delay = t0 + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(one, update, time.perf_counter()))
+    samples = [f.result() for f in futures]
+    return samples, time.perf_counter() - t0
+
+
+def _pct(values: list[float]) -> dict:
+    return {f"p{p}": round(percentile(values, p), 1) if values else None for p in (50, 95, 99)}
+
+
+def summarize(samples: list[Sample], elapsed_s: float, services: dict[str, StandIn], cache=None) -> dict:
+    n = len(samples)
+    e2e = [s.e2e_ms for s in samples]
+    status: dict[str, int] = {}
+    errors_by_stage: dict[str, int] = {}
+    for s in samples:
+        status[s.status] = status.get(s.status, 0) + 1
+        if s.error_stage:
+            errors_by_stage[s.error_stage] = errors_by_stage.get(s.error_stage, 0) + 1
+    where: dict[str, dict] = {"worker_slot": {"queued": _pct([s.pool_wait_ms for s in samples])}}
+    for stage in STAGES:
+        queued = [s.queue_ms.get(stage, 0.0) for s in samples if stage in s.stages_ms]
+        total = [s.stages_ms[stage] for s in samples if stage in s.stages_ms]
+        where[stage] = {
+            "queued": _pct(queued),
+            "service": _pct([max(0.0, t - q) for t, q in zip(total, queued)]),
+            "share_of_e2e": round(sum(total) / sum(e2e), 3) if e2e and sum(e2e) else None,
+        }
+    return {
+        "requests": n,
+        "elapsed_s": round(elapsed_s, 2),
+        "throughput_rps": round(n / elapsed_s, 2) if elapsed_s else None,
+        "e2e_ms": _pct(e2e) | {"max": round(max(e2e), 1) if e2e else None},
+        "slow_replies": sum(1 for v in e2e if v > SLOW_REPLY_THRESHOLD_MS),
+        "status": status,
+        "error_rate": round(status.get("error", 0) / n, 4) if n else None,
+        "errors_by_stage": errors_by_stage,
+        "rate_limited_replies": sum(1 for s in samples if s.rate_limited),
+        "stand_in_calls": {name: {"calls": sv.calls, "429": sv.rate_limited} for name, sv in services.items()},
+        "cached_replies": sum(1 for s in samples if s.cached),
+        "cache": cache.summary() if cache is not None else None,
+        "where_time_goes": where,
+    }
+
+
+def _print_report(summary: dict) -> None:
+    e2e = summary["e2e_ms"]
+    print(f"requests={summary['requests']} elapsed={summary['elapsed_s']}s throughput={summary['throughput_rps']} req/s")
+    print(f"end-to-end ms: p50={e2e['p50']} p95={e2e['p95']} p99={e2e['p99']} max={e2e['max']}")
+    print(f"replies over {SLOW_REPLY_THRESHOLD_MS} ms: {summary['slow_replies']}")
+    print("status: " + " ".join(f"{k}={v}" for k, v in sorted(summary["status"].items())))
+    print(f"error rate: {summary['error_rate']:.2%}  by stage: {summary['errors_by_stage'] or '-'}"
+          f"  caused by 429: {summary['rate_limited_replies']}")
+    print("stand-in calls: " + " ".join(f"{k}={v['calls']} (429: {v['429']})" for k, v in summary["stand_in_calls"].items()))
+    c = summary["cache"]
+    if c is not None:
+        print(
+            f"answer cache: lookups={c['lookups']} hit_rate={c['hit_rate']} llm_calls_avoided={c['llm_calls_avoided']}"
+            f" stores={c['stores']} audits={c['audits']} suspected_false_hits={c['false_hit_suspects']}"
+        )
+    print(f"\n{'where':<14} {'queued p50':>10} {'p95':>8} {'p99':>8} {'service p50':>12} {'p95':>8} {'p99':>8} {'share':>6}")
+    for name, w in summary["where_time_goes"].items():
+        q, sv = w["queued"], w.get("service") or {}
+        share = w.get("share_of_e2e")
+        cols = [_fmt(q.get(p), 10 if p == "p50" else 8) for p in ("p50", "p95", "p99")]
+        cols += [_fmt(sv.get(p), 12 if p == "p50" else 8) for p in ("p50", "p95", "p99")]
+        print(f"{name:<14} " + " ".join(cols) + f" {'-' if share is None else f'{share:.0%}':>6}")
+
+
+def _fmt(value: Optional[float], width: int) -> str:
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.1f}"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline load test of the Telegram answer path (local stand-ins)")
+    parser.add_argument("--requests", type=int, default=500, help="Webhook updates to send (default 500)")
+    parser.add_argument("--rate", type=float, default=0.0, help="Arrivals per second; 0 = all at once (default 0)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Max requests in flight, i.e. n8n execution slots (default 50)")
+    parser.add_argument("--payloads", type=Path, default=None, help="Recorded updates (JSONL / JSON array); cycled to --requests")
+    parser.add_argument("--students", type=int, default=300, help="Distinct synthetic senders (default 300)")
+    parser.add_argument("--photo-rate", type=float, default=0.1, help="Synthetic share of photo+caption messages (default 0.1)")
+    parser.add_argument("--empty-rate", type=float, default=0.02, help="Synthetic share of messages without text (default 0.02)")
+    parser.add_argument("--escalate-rate", type=float, default=0.1, help="Share of LLM answers that are ESCALATE (default 0.1)")
+    parser.add_argument("--sigma", type=float, default=0.4, help="Lognormal latency spread for all stand-ins (default 0.4)")
+    parser.add_argument("--paraphrase-rate", type=float, default=0.5, help="Synthetic share of paraphrased questions (default 0.5)")
+    parser.add_argument("--cache", action="store_true", help="Enable the in-memory semantic answer cache")
+    parser.add_argument("--cache-threshold", type=float, default=None, help="Cosine similarity for a cache hit (default lib.answer_cache)")
+    parser.add_argument("--cache-audit-rate", type=float, default=None, help="Share of hits audited (default lib.answer_cache)")
+    parser.add_argument("--shared", type=int, default=0, help="Subscribed shared corpora queried alongside the institute namespace (default 0)")
+    parser.add_argument("--gemini-rpm", type=int, default=0, help="Run embeds through a private quota broker at this RPM (default off)")
+    parser.add_argument("--institute-id", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, default=None, help="Also write the summary here")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show lib warnings (e.g. each 429 retry)")
+    for name, (median_ms, capacity) in DEFAULT_SERVICES.items():
+        flag = name.replace("_", "-")
+        parser.add_argument(f"--{flag}-ms", type=float, default=median_ms, help=f"Median {name} latency (default {median_ms:g})")
+        parser.add_argument(f"--{flag}-capacity", type=int, default=capacity, help=f"Max concurrent {name} calls; 0 = unlimited")
+        parser.add_argument(f"--{flag}-429", type=float, default=0.0, help=f"Share of {name} calls answered with 429")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.ERROR, format="%(levelname)s %(name)s: %(message)s")
+    if not args.verbose:
+        # Failed requests are counted in the report; their tracebacks only with -v.
+        logging.getLogger("lib.answer_flow").setLevel(logging.CRITICAL)
+
+    # Never touch the host's real quota bucket (GEMINI_RPM / GEMINI_QUOTA_DB from .env).
+    quota_dir = tempfile.TemporaryDirectory(prefix="margai_loadtest_")
+    os.environ["GEMINI_RPM"] = str(args.gemini_rpm)
+    os.environ["GEMINI_QUOTA_DB"] = str(Path(quota_dir.name) / "quota.sqlite")
+
+    services = {
+        name: StandIn(
+            name,
+            getattr(args, f"{name}_ms"),
+            getattr(args, f"{name}_capacity"),
+            getattr(args, f"{name}_429"),
+            args.sigma,
+            args.seed + i,
+        )
+        for i, name in enumerate(DEFAULT_SERVICES)
+    }
+    if args.payloads:
+        recorded = load_payloads(args.payloads)
+        if not recorded:
+            print(f"No payloads in {args.payloads}", file=sys.stderr)
+            return 1
+        updates = [recorded[i % len(recorded)] for i in range(args.requests)]
+    else:
+        updates = synthetic_updates(
+            args.requests, args.students, args.photo_rate, args.empty_rate, args.seed, args.paraphrase_rate
+        )
+
+    shared = [f"shared-corpus-{i}" for i in range(args.shared)]
+    cache = None
+    if args.cache:
+        from lib.answer_cache import DEFAULT_AUDIT_RATE, DEFAULT_THRESHOLD, AnswerCache
+
+        cache = AnswerCache(
+            None,
+            threshold=DEFAULT_THRESHOLD if args.cache_threshold is None else args.cache_threshold,
+            audit_rate=DEFAULT_AUDIT_RATE if args.cache_audit_rate is None else args.cache_audit_rate,
+            seed=args.seed,
+        )
+    deps = _build_deps(services, args.escalate_rate, args.seed, shared, cache)
+    print(f"Sending {len(updates)} updates: rate={args.rate or 'burst'} concurrency={args.concurrency}", file=sys.stderr)
+    samples, elapsed = run_load(updates, deps, args.rate, args.concurrency, args.institute_id)
+    if cache is not None:
+        from lib.answer_flow import drain_after_reply
+
+        drain_after_reply()  # post-reply stores / audits run in the background; count them in the cache stats
+    summary = summarize(samples, elapsed, services, cache)
+    _print_report(summary)
+    if args.json:
+        args.json.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    quota_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,7 @@ Usage (from repo root, venv + .env):
     --top-k 10
 
 Optional: --json for machine-readable output.
+Optional: --shared-namespace shared-ncert-10-science (repeatable) to also search shared corpora, merged by score.
 Does not modify prompts, chunking, or n8n workflows.
 """
 from __future__ import annotations
@@ -28,9 +29,9 @@ from pathlib import Path
 _PILOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(_PILOT))
 
-from lib.config import get_settings
 from lib.embedding import EMBEDDING_MODEL, get_embedding
 from lib.pinecone_client import get_pinecone_index, query_index
+from lib.timing import start_trace
 
 
 def main() -> int:
@@ -48,9 +49,17 @@ def main() -> int:
         help="Pinecone namespace (default: INSTITUTE_ID env or '1')",
     )
     parser.add_argument("--top-k", type=int, default=10, help="Number of matches (default 10)")
+    parser.add_argument(
+        "--shared-namespace",
+        action="append",
+        default=[],
+        help="Also query this shared corpus namespace (repeatable; lib.corpora)",
+    )
     parser.add_argument("--json", action="store_true", help="Print JSON only")
     args = parser.parse_args()
 
+    from lib.config import get_settings
+
     settings = get_settings()
     ns = args.namespace
     if ns is None:
@@ -67,23 +76,25 @@ def main() -> int:
 
     index_name = settings.pinecone_index_name
 
-    vector = get_embedding(args.query, api_key=settings.gemini_api_key, model=EMBEDDING_MODEL)
-    index = get_pinecone_index(settings.pinecone_api_key, index_name)
-    res = query_index(index, vector, namespace=str(ns), top_k=args.top_k, include_metadata=True)
-
-    matches = res.get("matches", []) if isinstance(res, dict) else getattr(res, "matches", []) or []
+    with start_trace() as trace:
+        vector = get_embedding(args.query, api_key=settings.gemini_api_key, model=EMBEDDING_MODEL)
+        index = get_pinecone_index(settings.pinecone_api_key, index_name)
+        res = query_index(
+            index, vector, namespace=str(ns), top_k=args.top_k, include_metadata=True,
+            shared_namespaces=args.shared_namespace,
+        )
+    timings_ms = {k: round(v, 1) for k, v in trace.stages_ms.items()}
 
     rows = []
-    for rank, m in enumerate(matches, 1):
-        mid = m.get("id") if isinstance(m, dict) else getattr(m, "id", None)
-        score = m.get("score") if isinstance(m, dict) else getattr(m, "score", None)
-        md = (m.get("metadata") if isinstance(m, dict) else getattr(m, "metadata", {})) or {}
+    for rank, m in enumerate(res["matches"], 1):
+        md = m["metadata"]
         text = md.get("text") or md.get("pageContent") or ""
         rows.append(
             {
                 "rank": rank,
-                "id": mid,
-                "score": float(score) if score is not None else None,
+                "id": m["id"],
+                "score": m["score"],
+                "namespace": m["namespace"],
                 "metadata": {k: v for k, v in md.items() if k != "text"},
                 "text": text,
                 "text_preview_400": (text[:400] + "…") if len(text) > 400 else text,
@@ -96,8 +107,10 @@ def main() -> int:
         "embed_model": EMBEDDING_MODEL,
         "index": index_name,
         "namespace": str(ns),
+        "shared_namespaces": args.shared_namespace,
         "top_k": args.top_k,
         "match_count": len(rows),
+        "timings_ms": timings_ms,
         "matches": rows,
     }
 
@@ -110,8 +123,11 @@ def main() -> int:
     print(f"EMBED_MODEL   = {EMBEDDING_MODEL}")
     print(f"INDEX         = {index_name}")
     print(f"NAMESPACE     = {ns}")
+    if args.shared_namespace:
+        print(f"SHARED        = {args.shared_namespace}")
     print(f"TOP_K         = {args.top_k}")
     print(f"MATCHES       = {len(rows)}")
+    print(f"TIMINGS_MS    = {timings_ms}")
     print()
 
     needle = "box 4.3"
@@ -120,7 +136,7 @@ def main() -> int:
         tlow = (r.get("text") or "").lower()
         if needle in tlow:
             found_box = True
-        print(f"--- RANK={r['rank']} SCORE={r['score']} ID={r['id']} ---")
+        print(f"--- RANK={r['rank']} SCORE={r['score']} NS={r['namespace']} ID={r['id']} ---")
         meta = r.get("metadata") or {}
         for k in sorted(meta.keys()):
             v = meta[k]
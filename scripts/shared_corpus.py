@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Manage shared corpora (005 migration): books ingested once into Pinecone namespace shared-<slug>.
+Usage: python scripts/shared_corpus.py create <corpus_slug> [--title TITLE]
+       python scripts/shared_corpus.py subscribe <institute_slug> <corpus_slug>
+       python scripts/shared_corpus.py unsubscribe <institute_slug> <corpus_slug>
+       python scripts/shared_corpus.py list
+Ingest a book into a corpus with: python scripts/ingest_pdf.py <pdf> <institute_slug> --shared <corpus_slug>
+(refused until the n8n answer path queries shared namespaces; lib.corpora.SHARED_NAMESPACES_SERVED).
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from lib.corpora import get_or_create_corpus, shared_namespace
+from lib.supabase_client import get_supabase
+
+
+def _institute_id(sb, slug: str) -> int:
+    r = sb.table("institutes").select("id").eq("slug", slug).execute()
+    if not r.data:
+        print(f"No institute with slug {slug!r}", file=sys.stderr)
+        sys.exit(1)
+    return int(r.data[0]["id"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage shared corpora and institute subscriptions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("create", help="Create a shared corpus")
+    p.add_argument("corpus_slug")
+    p.add_argument("--title", type=str, default=None)
+    for name in ("subscribe", "unsubscribe"):
+        p = sub.add_parser(name, help=f"{name.capitalize()} an institute to/from a corpus")
+        p.add_argument("institute_slug")
+        p.add_argument("corpus_slug")
+    sub.add_parser("list", help="List corpora and their subscribers")
+    args = parser.parse_args()
+    if getattr(args, "corpus_slug", None):
+        try:
+            shared_namespace(args.corpus_slug)
+        except ValueError as e:
+            parser.error(str(e))
+
+    from lib.config import get_settings
+    settings = get_settings()
+    url = os.environ.get("SUPABASE_URL") or settings.supabase_url
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or settings.supabase_service_role_key
+    if not url or not key:
+        print("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY", file=sys.stderr)
+        sys.exit(1)
+    sb = get_supabase(url, key)
+
+    if args.command == "create":
+        corpus_id = get_or_create_corpus(sb, args.corpus_slug, args.title)
+        print(f"Corpus {args.corpus_slug} id={corpus_id} namespace={shared_namespace(args.corpus_slug)}")
+    elif args.command == "subscribe":
+        institute_id = _institute_id(sb, args.institute_slug)
+        corpus_id = get_or_create_corpus(sb, args.corpus_slug)
+        sb.table("institute_corpus_subscriptions").upsert(
+            {"institute_id": institute_id, "corpus_id": corpus_id}, on_conflict="institute_id,corpus_id"
+        ).execute()
+        print(f"{args.institute_slug} (id={institute_id}) subscribed to {shared_namespace(args.corpus_slug)}")
+    elif args.command == "unsubscribe":
+        institute_id = _institute_id(sb, args.institute_slug)
+        corpus_id = get_or_create_corpus(sb, args.corpus_slug)
+        sb.table("institute_corpus_subscriptions").delete().eq("institute_id", institute_id).eq("corpus_id", corpus_id).execute()
+        print(f"{args.institute_slug} (id={institute_id}) unsubscribed from {args.corpus_slug}")
+    else:
+        corpora = sb.table("shared_corpora").select("id, slug, title").order("slug").execute().data or []
+        subs = sb.table("institute_corpus_subscriptions").select("corpus_id, institutes(slug)").execute().data or []
+        for c in corpora:
+            names = sorted((s.get("institutes") or {}).get("slug", "?") for s in subs if s["corpus_id"] == c["id"])
+            print(f"{shared_namespace(c['slug'])}\t{c.get('title') or ''}\tsubscribers: {', '.join(names) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,12 @@
 """
 Local test for ingestion pipeline: extraction + chunking only (no Supabase/Pinecone/Gemini).
 Use to verify code with a sample PDF. Full ingest requires .env (SUPABASE_*, GEMINI_API_KEY, PINECONE_API_KEY).
-Usage: python scripts/test_ingest_local.py <path_to.pdf> [institute_slug]
+Usage: python scripts/test_ingest_local.py <path_to.pdf> [institute_slug] [--workers N] [--no-cache]
+       [--chunk-size N] [--overlap N]
+--workers N: parallel page-range extraction (lib.extraction) with per-page timing.
+Extraction is cached by PDF sha256 (lib.extraction_cache), so chunking experiments re-run in seconds.
 """
+import argparse
 import sys
 from pathlib import Path
 
@@ -14,40 +18,45 @@ if UPSC_BACKEND.exists():
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 
-def extract_text(file_path: Path) -> tuple[str, int, str | None]:
-    try:
-        from app.services.pdf_extraction_service import extract_hybrid
-        result = extract_hybrid(file_path)
-        if not result.is_valid:
-            return result.text or "", result.page_count, result.error_message or "Extraction failed"
-        return result.text, result.page_count, None
-    except ImportError:
-        import pymupdf
-        doc = pymupdf.open(file_path)
-        try:
-            text = "\n\n".join(doc[i].get_text() for i in range(len(doc)))
-            return text.strip(), len(doc), None
-        finally:
-            doc.close()
-    except Exception as e:
-        return "", 0, str(e)
+def extract_text(file_path: Path, workers: int = 0, use_cache: bool = True):
+    from lib.extraction_cache import extract_cached, get_extraction_cache
+    return extract_cached(file_path, workers=workers, cache=get_extraction_cache() if use_cache else None)
 
 
 def main() -> int:
-    pdf_path = (Path(sys.argv[1]) if len(sys.argv) > 1 else REPO_ROOT / "manual-qc-pdfs" / "small_test_upsc.pdf").resolve()
-    slug = sys.argv[2] if len(sys.argv) > 2 else "test-institute"
+    parser = argparse.ArgumentParser(description="Local extraction + chunking check (no external services)")
+    parser.add_argument("pdf_path", nargs="?", type=Path, default=REPO_ROOT / "manual-qc-pdfs" / "small_test_upsc.pdf")
+    parser.add_argument("institute_slug", nargs="?", default="test-institute")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel page extraction with N processes (0 = serial)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the extraction cache")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Override lib.chunking.CHUNK_SIZE")
+    parser.add_argument("--overlap", type=int, default=None, help="Override lib.chunking.OVERLAP")
+    args = parser.parse_args()
+    pdf_path = args.pdf_path.resolve()
+    slug = args.institute_slug
     if not pdf_path.exists():
         print("PDF not found:", pdf_path, file=sys.stderr)
         return 1
-    text, page_count, err = extract_text(pdf_path)
+    result = extract_text(pdf_path, workers=args.workers, use_cache=not args.no_cache)
+    text, page_count, err = result.text, result.page_count, result.error
+    if result.cached:
+        print("Extraction: cache hit")
+    elif args.workers > 0:
+        print("Parallel extraction: workers=%s ocr_pages=%s" % (args.workers, result.ocr_pages))
+        for r in result.slowest(10):
+            print("  page %s: %.3fs (%s)" % (r.page + 1, r.seconds, r.method))
     if err:
         print("Extraction failed:", err, file=sys.stderr)
         return 1
-    from lib.chunking import chunk_with_ids, id_prefix_from_path
+    from lib.chunking import CHUNK_SIZE, OVERLAP, chunk_with_ids, id_prefix_from_path
     prefix = id_prefix_from_path(pdf_path, slug)
-    chunks = chunk_with_ids(text, prefix)
+    chunk_size = args.chunk_size if args.chunk_size is not None else CHUNK_SIZE
+    overlap = args.overlap if args.overlap is not None else OVERLAP
+    chunks = chunk_with_ids(text, prefix, chunk_size=chunk_size, overlap=overlap)
     print("Extraction: page_count=%s total_chars=%s" % (page_count, len(text)))
     print("Chunking: num_chunks=%s" % len(chunks))
+    from lib.dedup import dedup_chunks
+    print("Dedup: near_duplicates=%s (embeddings saved within this PDF)" % dedup_chunks(chunks).saved)
     if chunks:
         print("Sample chunk id=%s len=%s" % (chunks[0][0], len(chunks[0][1])))
     print("Local test OK. For full ingest set SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, GEMINI_API_KEY, PINECONE_API_KEY and run ingest_pdf.py")
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """
 Weekly insight report: query query_logs (last 7 days, institute_id=1), compute totals, escalation %, top topics.
+Latency: p50/p95/p99 per answer stage from query_timings (002 migration) + replies over the slow threshold.
+  Replies timed by n8n only have db, send, qa_chain (embed + Pinecone + Gemini) and total.
 Output = email body text only; you send the email manually.
-Usage: python scripts/weekly_report.py [--institute-id 1]
+Usage: python scripts/weekly_report.py [--institute-id 1] [--slow-ms 5000]
 """
 import argparse
 import os
@@ -12,10 +14,13 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from supabase import create_client
-from lib.config import get_settings
+from lib.supabase_client import get_supabase
+from lib.timing import SLOW_REPLY_THRESHOLD_MS, STAGES, percentile
 
 # Placeholder topic keywords (JEE, NEET, UPSC) for counting
+# Rows per request when paging (Supabase returns at most 1000 per select).
+_PAGE_SIZE = 1000
+
 TOPIC_KEYWORDS = {
     "jee": ["kinematics", "thermodynamics", "electrochemistry", "chemical bonding", "mechanics", "algebra"],
     "neet": ["biology", "anatomy", "physiology", "botany", "zoology", "cell"],
@@ -23,11 +28,28 @@ TOPIC_KEYWORDS = {
 }
 
 
+def _select_since(sb, table: str, columns: str, institute_id: int, since: str) -> list[dict]:
+    """All of an institute's rows since `since`, keyset-paged on id (a single select stops at 1000 rows)."""
+    rows: list[dict] = []
+    last = None
+    while True:
+        q = sb.table(table).select("id," + columns).eq("institute_id", institute_id).gte("timestamp", since)
+        if last is not None:
+            q = q.gt("id", last)
+        page = q.order("id").limit(_PAGE_SIZE).execute().data or []
+        rows.extend(page)
+        if len(page) < _PAGE_SIZE:
+            return rows
+        last = page[-1]["id"]
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Generate weekly insight report (email body text)")
     parser.add_argument("--institute-id", type=int, default=1, help="Institute ID (default 1)")
+    parser.add_argument("--slow-ms", type=int, default=SLOW_REPLY_THRESHOLD_MS, help=f"Slow reply threshold in ms (default {SLOW_REPLY_THRESHOLD_MS})")
     args = parser.parse_args()
 
+    from lib.config import get_settings
     settings = get_settings()
     url = os.environ.get("SUPABASE_URL") or settings.supabase_url
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or settings.supabase_service_role_key
@@ -35,7 +57,7 @@ def main() -> None:
         print("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY", file=sys.stderr)
         sys.exit(1)
 
-    sb = create_client(url, key)
+    sb = get_supabase(url, key)
     since = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
     r = sb.table("query_logs").select("id,query_text,escalated,student_telegram_id,student_name").eq("institute_id", args.institute_id).gte("timestamp", since).execute()
     rows = r.data or []
@@ -65,6 +87,20 @@ def main() -> None:
     # Who escalated (student_telegram_id where escalated=true)
     escalated_students = list({(row.get("student_telegram_id"), row.get("student_name")) for row in rows if row.get("escalated")})
 
+    # Per-stage latency (query_timings); table may be absent before 002 migration
+    try:
+        timing_rows = _select_since(
+            sb, "query_timings", ",".join(f"{s}_ms" for s in STAGES) + ",qa_chain_ms,total_ms", args.institute_id, since
+        )
+    except Exception as e:
+        print(f"query_timings unavailable: {e}", file=sys.stderr)
+        timing_rows = []
+    stage_values = {
+        s: [float(row[f"{s}_ms"]) for row in timing_rows if row.get(f"{s}_ms") is not None]
+        for s in (*STAGES, "qa_chain", "total")
+    }
+    slow_count = sum(1 for v in stage_values["total"] if v > args.slow_ms)
+
     # Build email body
     inst = sb.table("institutes").select("email_for_report").eq("id", args.institute_id).execute()
     to_email = (inst.data or [{}])[0].get("email_for_report") or ""
@@ -88,6 +124,17 @@ def main() -> None:
     ])
     for sid, count in top_students:
         lines.append(f"  - {sid}: {count} queries")
+    lines.extend([
+        "",
+        f"Answer latency (ms, {len(timing_rows)} timed replies):",
+    ])
+    for stage, values in stage_values.items():
+        if not values:
+            lines.append(f"  - {stage}: no data")
+            continue
+        p50, p95, p99 = (percentile(values, p) for p in (50, 95, 99))
+        lines.append(f"  - {stage}: p50={p50:.0f} p95={p95:.0f} p99={p99:.0f} (n={len(values)})")
+    lines.append(f"Replies over {args.slow_ms} ms: {slow_count}")
     if escalated_students:
         lines.extend([
             "",
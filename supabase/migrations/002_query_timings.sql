@@ -0,0 +1,28 @@
+-- MargAI Ghost Tutor pilot: per-stage answer-path latency (webhook received → Telegram reply sent).
+-- One row per student query; written by lib.timing.record_query_timings or the n8n flow.
+-- n8n cannot time the QA chain's sub-nodes (embed, Pinecone, Gemini) apart: its rows fill qa_chain_ms and leave
+-- embed_ms / vector_query_ms / llm_ms NULL. Python rows fill all of them (qa_chain_ms = their sum).
+-- Run after 001_initial_schema.sql.
+
+CREATE TABLE IF NOT EXISTS query_timings (
+  id              UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  query_log_id    UUID REFERENCES query_logs(id) ON DELETE CASCADE,
+  institute_id    BIGINT NOT NULL REFERENCES institutes(id) ON DELETE CASCADE,
+  timestamp       TIMESTAMPTZ DEFAULT NOW(),
+  embed_ms        REAL,
+  vector_query_ms REAL,
+  llm_ms          REAL,
+  db_ms           REAL,
+  send_ms         REAL,
+  qa_chain_ms     REAL,
+  total_ms        REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_query_timings_institute_timestamp ON query_timings(institute_id, timestamp DESC);
+
+ALTER TABLE query_timings ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY query_timings_select_pilot ON query_timings
+  FOR SELECT USING (institute_id = 1);
+
+COMMENT ON TABLE query_timings IS 'Per-stage answer latency in ms (embed, vector_query, llm, db, send, qa_chain, total)';
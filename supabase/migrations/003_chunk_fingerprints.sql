@@ -0,0 +1,23 @@
+-- MargAI Ghost Tutor pilot: chunk fingerprints for near-duplicate elimination before embedding (lib/dedup.py).
+-- One row per chunk produced by ingest; alias_of set when the chunk was not embedded because it
+-- near-duplicates a kept chunk (same PDF or an earlier one in the namespace).
+-- Run after 002_query_timings.sql.
+
+CREATE TABLE IF NOT EXISTS chunk_fingerprints (
+  namespace    TEXT NOT NULL,
+  chunk_id     TEXT NOT NULL,
+  source_file  TEXT,
+  simhash      TEXT,
+  content_hash TEXT NOT NULL,
+  alias_of     TEXT,
+  created_at   TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (namespace, chunk_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chunk_fingerprints_kept ON chunk_fingerprints(namespace) WHERE alias_of IS NULL;
+
+-- Backend-only (service_role bypasses RLS); no anon policy.
+ALTER TABLE chunk_fingerprints ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON COLUMN chunk_fingerprints.simhash IS '64-bit SimHash (hex) of word 3-shingles; NULL for very short chunks';
+COMMENT ON COLUMN chunk_fingerprints.alias_of IS 'chunk_id of the kept near-duplicate; NULL = chunk was embedded';
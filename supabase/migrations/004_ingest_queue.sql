@@ -0,0 +1,115 @@
+-- MargAI Ghost Tutor pilot: uploads as an ingest job queue (scripts/ingest_worker.py).
+-- Enqueue = insert uploads row with status 'queued' (e.g. ingest_pdf.py --enqueue).
+-- Workers claim rows atomically (FOR UPDATE SKIP LOCKED) within a per-institute concurrency limit,
+-- heartbeat while running, and rows whose heartbeat goes stale (worker crash) are re-queued.
+-- Plain Postgres 13+ compatible (no Supabase-only features) so it can be tested against a local Postgres.
+-- Run after 003_chunk_fingerprints.sql.
+
+ALTER TABLE uploads DROP CONSTRAINT IF EXISTS uploads_status_check;
+ALTER TABLE uploads ADD CONSTRAINT uploads_status_check
+  CHECK (status IN ('queued', 'processing', 'completed', 'failed'));
+
+ALTER TABLE uploads ADD COLUMN IF NOT EXISTS claimed_by   TEXT;
+ALTER TABLE uploads ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ;
+ALTER TABLE uploads ADD COLUMN IF NOT EXISTS started_at   TIMESTAMPTZ;
+ALTER TABLE uploads ADD COLUMN IF NOT EXISTS attempts     INT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_uploads_queued ON uploads(created_at) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_uploads_processing ON uploads(institute_id) WHERE status = 'processing';
+
+-- Claim the oldest queued upload whose institute is below p_max_per_institute running jobs.
+-- Also re-queues (or fails, after p_max_attempts) rows whose heartbeat is older than p_stale_after_s.
+-- Rows in 'processing' without heartbeat_at (manual ingest_pdf.py runs) are never touched.
+CREATE OR REPLACE FUNCTION claim_upload(
+  p_worker_id TEXT,
+  p_max_per_institute INT DEFAULT 1,
+  p_stale_after_s INT DEFAULT 600,
+  p_max_attempts INT DEFAULT 3
+)
+RETURNS TABLE (
+  id UUID, institute_id BIGINT, institute_slug TEXT, file_path TEXT, filename TEXT,
+  attempts INT, created_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+BEGIN
+  -- Claims are rare (one per job); serialising them keeps the per-institute count exact.
+  PERFORM pg_advisory_xact_lock(hashtext('margai_claim_upload'));
+
+  UPDATE uploads u SET
+    status = CASE WHEN u.attempts >= p_max_attempts THEN 'failed' ELSE 'queued' END,
+    error_message = CASE WHEN u.attempts >= p_max_attempts
+      THEN 'Worker heartbeat lost (' || u.claimed_by || ') after ' || u.attempts || ' attempts'
+      ELSE u.error_message END,
+    claimed_by = NULL,
+    heartbeat_at = NULL
+  WHERE u.status = 'processing'
+    AND u.heartbeat_at IS NOT NULL
+    AND u.heartbeat_at < NOW() - make_interval(secs => p_stale_after_s);
+
+  RETURN QUERY
+  WITH candidate AS (
+    SELECT q.id
+    FROM uploads q
+    WHERE q.status = 'queued'
+      AND (SELECT COUNT(*) FROM uploads r
+           WHERE r.institute_id = q.institute_id AND r.status = 'processing' AND r.claimed_by IS NOT NULL
+          ) < p_max_per_institute
+    ORDER BY q.created_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE uploads u SET
+    status = 'processing',
+    claimed_by = p_worker_id,
+    heartbeat_at = NOW(),
+    started_at = NOW(),
+    attempts = u.attempts + 1,
+    error_message = NULL
+  FROM candidate c, institutes i
+  WHERE u.id = c.id AND i.id = u.institute_id
+  RETURNING u.id, u.institute_id, i.slug, u.file_path, u.filename, u.attempts, u.created_at;
+END;
+$$;
+
+-- Refresh heartbeat for a worker's running jobs. Returns the ids the worker no longer owns (re-queued or
+-- re-claimed after a stale heartbeat, or deleted): the worker must stop those ingests so they don't run twice.
+-- Rows the ingest itself marked completed/failed keep claimed_by and are not returned.
+DROP FUNCTION IF EXISTS heartbeat_uploads(TEXT, UUID[]);
+CREATE FUNCTION heartbeat_uploads(p_worker_id TEXT, p_ids UUID[])
+RETURNS TABLE (lost_id UUID)
+LANGUAGE sql AS $$
+  UPDATE uploads SET heartbeat_at = NOW()
+  WHERE id = ANY(p_ids) AND claimed_by = p_worker_id AND status = 'processing';
+  SELECT x FROM unnest(p_ids) AS x
+  WHERE NOT EXISTS (SELECT 1 FROM uploads u WHERE u.id = x AND u.claimed_by = p_worker_id);
+$$;
+
+-- Mark a claimed job failed if the ingest process exited without recording an outcome.
+CREATE OR REPLACE FUNCTION fail_upload_if_processing(p_worker_id TEXT, p_id UUID, p_error TEXT)
+RETURNS BOOLEAN
+LANGUAGE sql AS $$
+  WITH t AS (
+    UPDATE uploads SET status = 'failed', error_message = p_error
+    WHERE id = p_id AND claimed_by = p_worker_id AND status = 'processing'
+    RETURNING 1
+  )
+  SELECT EXISTS (SELECT 1 FROM t);
+$$;
+
+-- Queue depth and job latency per institute (worker exports these as Prometheus gauges).
+CREATE OR REPLACE VIEW ingest_queue_stats AS
+SELECT
+  institute_id,
+  COUNT(*) FILTER (WHERE status = 'queued') AS queued,
+  COUNT(*) FILTER (WHERE status = 'processing' AND claimed_by IS NOT NULL) AS processing,
+  COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at) FILTER (WHERE status = 'queued')), 0)::REAL AS oldest_queued_s,
+  AVG(EXTRACT(EPOCH FROM started_at - created_at))
+    FILTER (WHERE started_at > NOW() - INTERVAL '1 day')::REAL AS avg_wait_s_24h,
+  AVG(EXTRACT(EPOCH FROM completed_at - started_at))
+    FILTER (WHERE status = 'completed' AND completed_at > NOW() - INTERVAL '1 day')::REAL AS avg_run_s_24h
+FROM uploads
+GROUP BY institute_id;
+
+COMMENT ON COLUMN uploads.claimed_by IS 'ingest_worker id holding the job; NULL for manual ingest_pdf.py runs';
+COMMENT ON COLUMN uploads.heartbeat_at IS 'Refreshed by the worker while running; stale rows are re-queued by claim_upload';
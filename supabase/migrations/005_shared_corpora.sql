@@ -0,0 +1,36 @@
+-- MargAI Ghost Tutor pilot: shared corpora (lib/corpora.py).
+-- A shared corpus (e.g. NCERT Class 10 Science) is ingested once into Pinecone namespace 'shared-<slug>';
+-- institutes subscribe to it and the answer path queries their own namespace plus their subscriptions.
+-- Run after 004_ingest_queue.sql.
+
+CREATE TABLE IF NOT EXISTS shared_corpora (
+  id         BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  slug       TEXT NOT NULL UNIQUE CHECK (slug ~ '^[a-z0-9][a-z0-9-]*$'),
+  title      TEXT,
+  created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS institute_corpus_subscriptions (
+  institute_id BIGINT NOT NULL REFERENCES institutes(id) ON DELETE CASCADE,
+  corpus_id    BIGINT NOT NULL REFERENCES shared_corpora(id) ON DELETE CASCADE,
+  created_at   TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (institute_id, corpus_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_corpus_subscriptions_corpus ON institute_corpus_subscriptions(corpus_id);
+
+-- Uploads into a shared corpus: institute_id is the uploading institute, corpus_id the target namespace.
+ALTER TABLE uploads ADD COLUMN IF NOT EXISTS corpus_id BIGINT REFERENCES shared_corpora(id) ON DELETE SET NULL;
+
+ALTER TABLE shared_corpora ENABLE ROW LEVEL SECURITY;
+ALTER TABLE institute_corpus_subscriptions ENABLE ROW LEVEL SECURITY;
+
+-- Pilot: same pattern as 001 (institute_id = 1). Backend/n8n uses service_role and bypasses RLS.
+CREATE POLICY shared_corpora_select_all ON shared_corpora
+  FOR SELECT USING (true);
+
+CREATE POLICY corpus_subscriptions_select_pilot ON institute_corpus_subscriptions
+  FOR SELECT USING (institute_id = 1);
+
+COMMENT ON TABLE shared_corpora IS 'Books ingested once into Pinecone namespace shared-<slug>';
+COMMENT ON COLUMN uploads.corpus_id IS 'Set when the PDF was ingested into a shared corpus instead of the institute namespace';
@@ -0,0 +1,87 @@
+-- MargAI Ghost Tutor pilot: persistence for the semantic answer cache (lib/answer_cache.py).
+-- Entries (query embedding, answer, chunk IDs used) per institute namespace; lib.answer_flow serves a cached
+-- answer when a new query's embedding is within the similarity threshold.
+-- The production answer path (n8n telegram-webhook.json) does not use the cache, so this migration adds no
+-- triggers on uploads / chunk_fingerprints / subscriptions. A Python answer path using it must invalidate itself:
+--   * bump_answer_cache_version(namespaces) after an upload into those namespaces completes;
+--   * invalidate_answer_cache_chunks(chunk_ids) after deleting vectors / fingerprints.
+-- Processes holding entries in memory re-check answer_cache_versions every few seconds.
+-- Run after 005_shared_corpora.sql. Optional: the load test keeps its cache in memory.
+
+CREATE TABLE IF NOT EXISTS answer_cache_versions (
+  namespace  TEXT PRIMARY KEY,
+  version    BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS answer_cache (
+  id          UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  namespace   TEXT NOT NULL,
+  version     BIGINT NOT NULL,
+  query_text  TEXT,
+  embedding   TEXT NOT NULL,
+  answer      TEXT NOT NULL,
+  chunk_ids   TEXT[] NOT NULL,
+  created_at  TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_answer_cache_namespace ON answer_cache(namespace, version);
+CREATE INDEX IF NOT EXISTS idx_answer_cache_chunks ON answer_cache USING GIN (chunk_ids);
+
+-- One row per cache lookup on the answer path (hit rate, LLM calls avoided, false-hit audits).
+CREATE TABLE IF NOT EXISTS answer_cache_events (
+  id                BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  institute_id      BIGINT NOT NULL REFERENCES institutes(id) ON DELETE CASCADE,
+  timestamp         TIMESTAMPTZ DEFAULT NOW(),
+  outcome           TEXT NOT NULL CHECK (outcome IN ('hit', 'miss')),
+  similarity        REAL,
+  entry_id          UUID,
+  audited           BOOLEAN NOT NULL DEFAULT FALSE,
+  chunk_overlap     REAL,
+  false_hit_suspect BOOLEAN
+);
+
+CREATE INDEX IF NOT EXISTS idx_answer_cache_events_institute_ts ON answer_cache_events(institute_id, timestamp DESC);
+
+-- Bump versions and drop entries for the given namespaces.
+CREATE OR REPLACE FUNCTION bump_answer_cache_version(p_namespaces TEXT[])
+RETURNS VOID
+LANGUAGE sql AS $$
+  INSERT INTO answer_cache_versions (namespace, version, updated_at)
+  SELECT DISTINCT ns, 1, NOW() FROM unnest(p_namespaces) AS ns
+  ON CONFLICT (namespace) DO UPDATE
+    SET version = answer_cache_versions.version + 1, updated_at = NOW();
+  DELETE FROM answer_cache WHERE namespace = ANY(p_namespaces);
+$$;
+
+-- Drop entries that used any of these chunks (and bump their namespaces so in-memory copies reload).
+-- Also callable directly (RPC) after deleting vectors from Pinecone by hand.
+CREATE OR REPLACE FUNCTION invalidate_answer_cache_chunks(p_chunk_ids TEXT[])
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_namespaces TEXT[];
+  v_count INT;
+BEGIN
+  WITH d AS (
+    DELETE FROM answer_cache WHERE chunk_ids && p_chunk_ids RETURNING namespace
+  )
+  SELECT array_agg(DISTINCT namespace), COUNT(*)::INT INTO v_namespaces, v_count FROM d;
+  IF v_count > 0 THEN
+    PERFORM bump_answer_cache_version(v_namespaces);
+  END IF;
+  RETURN v_count;
+END;
+$$;
+
+-- Backend-only (service_role bypasses RLS).
+ALTER TABLE answer_cache_versions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE answer_cache ENABLE ROW LEVEL SECURITY;
+ALTER TABLE answer_cache_events ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY answer_cache_events_select_pilot ON answer_cache_events
+  FOR SELECT USING (institute_id = 1);
+
+COMMENT ON COLUMN answer_cache.embedding IS 'L2-normalized float32 query embedding, base64';
+COMMENT ON COLUMN answer_cache.version IS 'answer_cache_versions.version of the namespace when stored; older versions are stale';
+COMMENT ON COLUMN answer_cache_events.chunk_overlap IS 'Audited hits: share of cached chunk IDs that a fresh retrieval also returns';
@@ -0,0 +1,75 @@
+"""lib.answer_cache.AnswerCache: version checks / reloads run in the background, lookups never wait for them."""
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+np = pytest.importorskip("numpy")
+
+from lib.answer_cache import AnswerCache, _encode, _normalize
+
+
+class _Result:
+    def __init__(self, data) -> None:
+        self.data = data
+
+
+class _Query:
+    def __init__(self, sb, table: str) -> None:
+        self.sb = sb
+        self.table = table
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        if self.table == "answer_cache_versions":
+            return _Result([{"version": self.sb.version}])
+        version = self.sb.version
+        self.sb.loading.set()
+        self.sb.gates[version].wait(5)
+        return _Result([{
+            "id": f"e{version}", "query_text": "q", "embedding": _encode(self.sb.vector),
+            "answer": f"answer v{version}", "chunk_ids": ["c1"],
+        }])
+
+
+class _Supabase:
+    """answer_cache_versions / answer_cache stand-in; loading a version blocks until its gate is set."""
+
+    def __init__(self, vector) -> None:
+        self.vector = vector
+        self.version = 1
+        self.loading = threading.Event()
+        self.gates = {1: threading.Event(), 2: threading.Event()}
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+
+def test_reload_runs_in_background_and_old_entries_keep_serving():
+    vector = _normalize(np.ones(8))
+    sb = _Supabase(vector)
+    cache = AnswerCache(sb, version_ttl_s=0.0)
+
+    # First lookup: nothing loaded yet, so a miss while the load runs in the background.
+    assert cache.lookup("1", vector) is None
+    sb.gates[1].set()
+    assert cache.wait_refreshed(timeout=5)
+    assert cache.lookup("1", vector).answer == "answer v1"
+    assert cache.wait_refreshed(timeout=5)
+
+    # Version moved: the reload blocks on its gate, yet lookups return the old entries and
+    # another namespace is not held up behind it.
+    sb.version = 2
+    sb.loading.clear()
+    assert cache.lookup("1", vector).answer == "answer v1"
+    assert sb.loading.wait(5)
+    assert cache.lookup("1", vector).answer == "answer v1"
+    assert cache.lookup("2", vector) is None
+    sb.gates[2].set()
+    assert cache.wait_refreshed(timeout=5)
+    assert cache.lookup("1", vector).answer == "answer v2"
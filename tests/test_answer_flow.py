@@ -0,0 +1,81 @@
+"""lib.answer_flow.handle_update: post-reply cache work runs after the reply, off the request thread."""
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from lib.answer_flow import CLARIFY_MESSAGE, AnswerDeps, drain_after_reply, handle_update
+
+
+class _BlockingCache:
+    """AnswerCache stand-in whose post-reply calls block until the test releases them, and log when they start."""
+
+    def __init__(self, events: list) -> None:
+        self.events = events
+        self.release = threading.Event()
+
+    def lookup(self, namespace, vector):
+        return None
+
+    def store(self, namespace, query_text, vector, answer, chunk_ids):
+        self.events.append(("store", threading.current_thread().name))
+        self.release.wait(5)
+
+    def should_audit(self) -> bool:
+        return False
+
+    def record_event(self, institute_id, hit, overlap, suspect):
+        self.events.append(("record_event", threading.current_thread().name))
+
+
+def test_post_reply_cache_work_runs_after_send_off_the_request_thread():
+    events: list = []
+    rows: list = []
+    cache = _BlockingCache(events)
+    deps = AnswerDeps(
+        embed=lambda text: [1.0, 0.0],
+        query=lambda vector, namespace, top_k: [{"id": "c1", "metadata": {"text": "ctx"}}],
+        chat=lambda question, contexts: "An answer.",
+        log_query=lambda row: "log-1",
+        mark_clarification=lambda query_log_id: None,
+        send=lambda chat_id, text: events.append(("send", threading.current_thread().name)),
+        record_timings=lambda trace, institute_id, query_log_id: rows.append(trace.to_row(institute_id, query_log_id)),
+        cache=cache,
+    )
+    update = {"update_id": 1, "message": {"text": "What is osmosis?", "chat": {"id": 7}, "from": {"id": 7}}}
+
+    # store() blocks until released: handle_update returning first shows the request thread did not wait for it.
+    result = handle_update(update, deps)
+    assert result.status == "answered"
+    assert len(rows) == 1
+    cache.release.set()
+    assert drain_after_reply(timeout=5)
+
+    me = threading.current_thread().name
+    assert [name for name, _ in events] == ["send", "store", "record_event"]
+    assert events[0][1] == me
+    assert all(thread != me for _, thread in events[1:])
+    # total_ms was frozen when the reply was sent, not when it is read.
+    assert round(result.trace.total_ms(), 1) == rows[0]["total_ms"]
+
+
+def test_failed_clarification_mark_keeps_the_sent_reply():
+    sent = []
+
+    def mark_clarification(query_log_id):
+        raise RuntimeError("db down")
+
+    deps = AnswerDeps(
+        embed=lambda text: [1.0, 0.0],
+        query=lambda vector, namespace, top_k: [],
+        chat=lambda question, contexts: "ESCALATE",
+        log_query=lambda row: "log-1",
+        mark_clarification=mark_clarification,
+        send=lambda chat_id, text: sent.append(text),
+    )
+    update = {"update_id": 2, "message": {"text": "Explain this", "chat": {"id": 7}, "from": {"id": 7}}}
+    result = handle_update(update, deps)
+    assert sent == [CLARIFY_MESSAGE]
+    assert (result.status, result.reply_text) == ("clarify", CLARIFY_MESSAGE)
+    assert (result.error_stage, result.error) == ("db", "db down")
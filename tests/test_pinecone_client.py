@@ -0,0 +1,71 @@
+"""lib.pinecone_client.query_index fan-out over shared namespaces and merge_matches (fake index, no network)."""
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from lib.pinecone_client import merge_matches, query_index
+
+
+class _Index:
+    def __init__(self, matches: dict, fail: tuple = ()) -> None:
+        self.matches = matches
+        self.fail = fail
+        self.threads: dict[str, str] = {}
+
+    def query(self, vector, namespace: str, top_k: int, include_metadata: bool = True) -> dict:
+        self.threads[namespace] = threading.current_thread().name
+        if namespace in self.fail:
+            raise RuntimeError(f"{namespace} down")
+        return {"matches": self.matches.get(namespace, [])[:top_k]}
+
+
+def _m(id_: str, score: float, text: str) -> dict:
+    return {"id": id_, "score": score, "metadata": {"text": text}}
+
+
+def test_merge_drops_passages_in_several_namespaces():
+    results = [
+        ("1", {"matches": [_m("inst_0", 0.90, "Photosynthesis needs light."), _m("inst_1", 0.70, "Only here.")]}),
+        ("shared-ncert", {"matches": [_m("ncert_0", 0.91, "photosynthesis  needs LIGHT"), _m("ncert_1", 0.80, "Shared only.")]}),
+    ]
+    merged = merge_matches(results, top_k=3)
+    assert [(m["namespace"], m["id"]) for m in merged] == [("shared-ncert", "ncert_0"), ("shared-ncert", "ncert_1"), ("1", "inst_1")]
+
+
+def test_primary_on_calling_thread_and_shared_failure_skipped():
+    index = _Index({"1": [_m("a", 0.5, "A")], "shared-x": [_m("x", 0.9, "X")]}, fail=("shared-y",))
+    res = query_index(index, [0.0], "1", top_k=5, shared_namespaces=["shared-x", "shared-y", "1"])
+    assert [m["id"] for m in res["matches"]] == ["x", "a"]
+    assert res["namespaces"] == ["1", "shared-x", "shared-y"]
+    assert index.threads["1"] == threading.current_thread().name
+    assert index.threads["shared-x"] != threading.current_thread().name
+
+
+def test_primary_failure_raises():
+    index = _Index({"shared-x": [_m("x", 0.9, "X")]}, fail=("1",))
+    with pytest.raises(RuntimeError):
+        query_index(index, [0.0], "1", top_k=5, shared_namespaces=["shared-x"])
+
+
+def test_single_namespace_returns_the_same_shape():
+    class _Match:
+        def __init__(self, id_, score, text):
+            self.id, self.score, self.metadata = id_, score, {"text": text}
+
+    class _Response:
+        matches = [_Match("a", 0.5, "A"), _Match("b", 0.4, "B")]
+
+    class _SdkIndex:
+        def query(self, vector, namespace, top_k, include_metadata=True):
+            return _Response()
+
+    res = query_index(_SdkIndex(), [0.0], "1", top_k=5)
+    assert res["namespaces"] == ["1"]
+    assert res["matches"] == [
+        {"id": "a", "score": 0.5, "metadata": {"text": "A"}, "namespace": "1"},
+        {"id": "b", "score": 0.4, "metadata": {"text": "B"}, "namespace": "1"},
+    ]
@@ -0,0 +1,70 @@
+"""lib.quota.QuotaBroker: server retry blocks, ingest reserve, interactive priority (SQLite file in tmp_path)."""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from lib.quota import PRIORITY_INGEST, PRIORITY_INTERACTIVE, QuotaBroker
+
+
+def _take_now(broker: QuotaBroker, priority: str, limit: int = 1000) -> int:
+    """Tokens `priority` can take without waiting."""
+    taken = 0
+    while taken < limit and broker._try_take(priority) == 0.0:
+        taken += 1
+    return taken
+
+
+def test_block_drains_bucket_and_polling_does_not_refill(tmp_path):
+    broker = QuotaBroker(tmp_path / "q.sqlite", rpm=600, burst=60)  # 10 tokens/s
+    broker.block_for(1.0)
+    deadline = time.time() + 1.0
+    while time.time() < deadline:
+        assert broker._try_take(PRIORITY_INTERACTIVE) > 0.0
+        time.sleep(0.05)
+    time.sleep(0.05)
+    # Refill starts when the block ends: ~0.5 token, not the ~10 accumulated while polling.
+    assert _take_now(broker, PRIORITY_INTERACTIVE) <= 2
+
+
+def test_shorter_block_does_not_shorten_longer_one(tmp_path):
+    broker = QuotaBroker(tmp_path / "q.sqlite", rpm=600, burst=60)
+    broker.block_for(1.0)
+    broker.block_for(0.1)
+    time.sleep(0.3)
+    assert broker._try_take(PRIORITY_INTERACTIVE) > 0.5
+
+
+def test_ingest_keeps_reserve_for_interactive(tmp_path):
+    broker = QuotaBroker(tmp_path / "q.sqlite", rpm=60, burst=10)  # 1 token/s, reserve 2
+    ingest = _take_now(broker, PRIORITY_INGEST)
+    assert ingest == 8
+    assert broker._try_take(PRIORITY_INGEST) > 0.0
+    assert _take_now(broker, PRIORITY_INTERACTIVE) == 2
+
+
+def test_ingest_progresses_with_low_rpm(tmp_path):
+    broker = QuotaBroker(tmp_path / "q.sqlite", rpm=10)  # burst 1: no room for a reserve
+    assert broker._try_take(PRIORITY_INGEST) == 0.0
+    wait = broker._try_take(PRIORITY_INGEST)
+    assert 0.0 < wait <= 60.0 / 10
+    broker.acquire(PRIORITY_INGEST, timeout=wait + 1.0)
+
+
+def test_ingest_yields_while_interactive_waits(tmp_path):
+    broker = QuotaBroker(tmp_path / "q.sqlite", rpm=60, burst=10)
+    assert _take_now(broker, PRIORITY_INTERACTIVE) == 10
+    # Empty bucket: the interactive caller marks itself waiting, which holds ingest back.
+    assert broker._try_take(PRIORITY_INTERACTIVE) > 0.0
+    wait = broker._try_take(PRIORITY_INGEST)
+    assert wait > 1.0
+
+
+def test_acquire_times_out(tmp_path):
+    broker = QuotaBroker(tmp_path / "q.sqlite", rpm=60, burst=1)
+    broker.acquire(PRIORITY_INTERACTIVE)
+    with pytest.raises(TimeoutError):
+        broker.acquire(PRIORITY_INTERACTIVE, timeout=0.1)